@@ -7,31 +7,447 @@ Automatically scans the codebase for common issues and generates a report.
 import os
 import re
 import json
+import time
+import heapq
+import hashlib
+import mmap
+import threading
 import subprocess
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, NamedTuple
 from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+NPM_AUDIT_TIMEOUT = 30  # seconds, counted from when the audit is started
+
+# --incremental keeps per-file findings here, next to the report
+CACHE_FILE = "codebase_analysis.cache.json"
+
+SLOWEST_FILES = 10  # listed in the report's stats
+
+# Directories never descended into: dependencies, VCS internals, caches
+EXCLUDED_DIRS = {"node_modules", ".git", "__pycache__"}
+
+
+def is_virtualenv(name: str) -> bool:
+    """Virtualenv directories (venv, .venv, ...) are skipped too"""
+    return "venv" in name
+
+
+def extension_of(name: str) -> str:
+    """The part of the name a *<extension> glob matches on: ".ts" for x.d.ts"""
+    return "." + name.rpartition(".")[2] if "." in name else ""
+
+
+# ==========================================
+# PATTERN SCANNER
+# ==========================================
+# Everything the checks need to know about a source file comes from one
+# pass: the rules for its file type are compiled into a single alternation
+# of named groups, and each match is credited to its rule with the line
+# it is on. A new check adds a rule, not a pass over every file.
+#
+# A rule is a keyword plus a pattern for what must follow it. Each branch
+# of the alternation opens with the keyword's first character, outside the
+# group, which lets `re` jump between candidate characters instead of
+# trying every branch at every position. Rules should check what follows
+# the keyword in a lookahead, so a long match (a secret up to the end of
+# the line, a def's parameters) never hides another rule's match inside
+# it. Named groups in the tail report as rules of their own (typed_def).
+#
+# Files of MMAP_THRESHOLD bytes or more are scanned through mmap, as bytes.
+
+MMAP_THRESHOLD = 1 << 20
+NEWLINE_CHUNK = 1 << 20
+GROUP_NAME_RE = re.compile(r'\(\?P(<|=)(\w+)')
+
+
+class Rule(NamedTuple):
+    name: str
+    keywords: Tuple[str, ...]
+    tail: str = ""  # regex for what must follow a keyword
+    ignore_case: bool = False  # for the keyword
+    word_start: bool = False  # keyword must start a word (\b before it)
+
+
+RULES: Dict[str, List[Rule]] = {
+    ".py": [
+        Rule("secret", ("api_key",), r'''\s*=\s*(?=["'][\w-]+["'])''', ignore_case=True),
+        Rule("secret", ("password", "secret", "token"), r'''\s*=\s*(?=["'].+["'])''', ignore_case=True),
+        Rule("bare_except", ("except",), r'\s*:'),
+        Rule("print", ("print",), r'\s*\(', word_start=True),
+        Rule("def", ("def",), r'(?=\s+\w+\s*\([^)]*\)(?P<typed_def>\s*->)?)'),
+    ],
+    ".ts": [
+        Rule("api_key", ("apiKey",), r'''(?=\s*:\s*["'][\w-]+["'])'''),
+        Rule("any", (":",), r'\s*any\b'),
+        Rule("console", ("console.",), r'(?:log|debug|info)'),
+    ],
+}
+
+_scanners: Dict[str, "Scanner"] = {}
+
+
+def add_rule(extension: str, rule: Rule):
+    """Plug a rule into the scan of every *<extension> file"""
+    RULES.setdefault(extension, []).append(rule)
+    _scanners.pop(extension, None)
+
+
+def scanner_for(extension: str) -> "Scanner":
+    """The compiled scanner for a file type"""
+    scanner = _scanners.get(extension)
+    if scanner is None:
+        scanner = _scanners[extension] = Scanner(RULES.get(extension, []))
+    return scanner
+
+
+def count_newlines(content, start: int, end: int) -> int:
+    """Newlines in content[start:end]; an mmap is counted a chunk at a time"""
+    if isinstance(content, str):
+        return content.count("\n", start, end)
+    return sum(content[i:min(i + NEWLINE_CHUNK, end)].count(b"\n") for i in range(start, end, NEWLINE_CHUNK))
+
+
+class Scanner:
+    """All rules for one file type, applied in a single pass"""
+    
+    def __init__(self, rules: List[Rule]):
+        branches = []
+        self.groups: Dict[str, str] = {}  # branch group -> rule
+        self.nested: Dict[str, List[Tuple[str, str]]] = {}  # branch group -> [(group, rule)]
+        for rule in rules:
+            for keyword in rule.keywords:
+                firsts = {keyword[0].lower(), keyword[0].upper()} if rule.ignore_case else {keyword[0]}
+                for first in sorted(firsts):
+                    group = f"b{len(branches)}"
+                    # Group names must be unique across the alternation: prefix nested ones per branch
+                    tail = GROUP_NAME_RE.sub(lambda m: f"(?P{m.group(1)}{group}_{m.group(2)}", rule.tail)
+                    rest = re.escape(keyword[1:])
+                    if rule.ignore_case and rest:
+                        rest = f"(?i:{rest})"
+                    if rule.word_start:
+                        rest = f"(?<=\\b{re.escape(first)}){rest}"
+                    branches.append(f"{re.escape(first)}(?P<{group}>{rest}{tail})")
+                    self.groups[group] = rule.name
+                    self.nested[group] = [(f"{group}_{name}", name) for name in re.compile(rule.tail).groupindex]
+        source = "|".join(branches) or "(?!)"
+        self.pattern = re.compile(source)
+        self.bytes_pattern = re.compile(source.encode())
+        self.names = list(dict.fromkeys(
+            [rule.name for rule in rules] + [name for nested in self.nested.values() for _, name in nested]))
+    
+    def scan(self, content) -> Dict:
+        """Line numbers of every rule's matches, plus the file's line count"""
+        found = {name: [] for name in self.names}
+        pattern = self.pattern if isinstance(content, str) else self.bytes_pattern
+        line, last = 1, 0
+        for match in pattern.finditer(content):
+            start = match.start()
+            line += count_newlines(content, last, start)
+            last = start
+            group = match.lastgroup
+            found[self.groups[group]].append(line)
+            for nested, name in self.nested[group]:
+                if match.start(nested) >= 0:
+                    found[name].append(line)
+        found["lines"] = line + count_newlines(content, last, len(content))
+        return found
+
+
+def rules_fingerprint() -> str:
+    """Changes whenever the analyzer or any of its rules, plugged-in ones included, changes"""
+    digest = hashlib.sha1(Path(__file__).read_bytes())
+    digest.update(repr(sorted(RULES.items())).encode())
+    return digest.hexdigest()
+
+
+class FindingsCache:
+    """Per-file scan results of an earlier run, reused while a file is unchanged"""
+    
+    def __init__(self, path: Path, rules: str):
+        self.path = path
+        self.rules = rules
+        self.previous: Dict[str, Dict] = {}
+        self.files: Dict[str, Dict] = {}  # this run's entries: deleted files drop out
+        self.npm_audit: Optional[Dict] = None
+        self.reused = 0
+        self.rescanned = 0
+        self.lock = threading.Lock()  # lookups come from --jobs worker threads
+        
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            # Findings made by other rules are worthless
+            if data.get("rules") == rules:
+                self.previous = data.get("files", {})
+                self.npm_audit = data.get("npm_audit")
+        except (OSError, ValueError):
+            pass
+    
+    def lookup(self, key: str, stamp: List[int], rescan) -> Dict:
+        """The entry for a file, rescanning only if its mtime/size and content hash both changed
+        
+        rescan(known_digest) returns the file's digest and, unless it equals known_digest, its scan.
+        """
+        entry = self.previous.get(key)
+        rescanned = False
+        if entry is None or entry["stamp"] != stamp:
+            digest, facts = rescan(entry["sha1"] if entry else None)
+            if facts is not None:
+                rescanned = True
+                entry = {"sha1": digest, "facts": facts}
+            entry = dict(entry, stamp=stamp)
+        with self.lock:
+            if rescanned:
+                self.rescanned += 1
+            else:
+                self.reused += 1
+            self.files[key] = entry
+        return entry
+    
+    def save(self):
+        """Write atomically, so an interrupted run leaves the previous cache intact"""
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, 'w') as f:
+            json.dump({"rules": self.rules, "files": self.files, "npm_audit": self.npm_audit}, f)
+        os.replace(temp_path, self.path)
+
+
+class FileIndex:
+    """One pruned walk of the tree, shared by every check"""
+    
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        self.files: List[Path] = []
+        self.sizes: Dict[Path, int] = {}
+        self.mtimes: Dict[Path, int] = {}
+        self.by_extension: Dict[str, List[Path]] = defaultdict(list)
+        self.virtualenvs: List[Path] = []
+        self.contents: Dict[Path, str] = {}
+        self._walk()
+    
+    def _walk(self):
+        """Walk depth-first in name order, pruning excluded directories before descending"""
+        pending = [self.root_dir]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            
+            subdirs = []
+            for entry in entries:
+                path = Path(entry.path)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if is_virtualenv(entry.name):
+                            self.virtualenvs.append(path)
+                        elif entry.name not in EXCLUDED_DIRS:
+                            subdirs.append(path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    # DirEntry caches the stat: one syscall per file for the whole run
+                    stat = entry.stat()
+                    self.sizes[path] = stat.st_size
+                    self.mtimes[path] = stat.st_mtime_ns
+                except OSError:
+                    continue
+                
+                self.files.append(path)
+                if "." in entry.name:
+                    self.by_extension[extension_of(entry.name)].append(path)
+            pending.extend(reversed(subdirs))
+    
+    def with_extension(self, extension: str) -> List[Path]:
+        """Files named *<extension>, the extension given with its dot"""
+        return self.by_extension.get(extension, [])
+    
+    def matching(self, prefix: str = "", suffix: str = "") -> List[Path]:
+        """Files whose name starts with prefix and ends with suffix"""
+        candidates = self.with_extension(extension_of(suffix)) if "." in suffix else self.files
+        return [f for f in candidates if f.name.startswith(prefix) and f.name.endswith(suffix)]
+    
+    def read(self, path: Path) -> str:
+        """File contents, read once however many checks ask"""
+        content = self.contents.get(path)
+        if content is None:
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                content = self.contents[path] = f.read()
+        return content
+
 
 class CodebaseAnalyzer:
-    def __init__(self, root_dir: str = "."):
+    def __init__(self, root_dir: str = ".", jobs: int = 1, incremental: bool = False,
+                 skip_npm_audit: bool = False, npm_audit_max_age: Optional[float] = None):
         self.root_dir = Path(root_dir)
+        self.jobs = max(1, jobs)
+        self.skip_npm_audit = skip_npm_audit
+        self.npm_audit_max_age = npm_audit_max_age  # seconds; None = never reuse a cached audit
         self.issues = defaultdict(list)
         self.stats = defaultdict(int)
+        self.cache = FindingsCache(self.root_dir / CACHE_FILE, rules_fingerprint()) if incremental else None
+        self._files = None
+        self._scans: Dict[Path, Dict] = {}
+        self._npm_audit = None  # (process, deadline) once started
+        self._npm_audit_key = None  # lockfile digest the audit ran against
+        self._npm_audit_result = None  # (returncode, stdout)
+        self._local = threading.local()  # per thread: the running check's issues and timing
+        
+        # Where the time goes: per check, and the slowest files to scan
+        self.timings: Dict[str, Dict] = {}
+        self._file_times: List[Tuple[float, str]] = []
+        self._timing_lock = threading.Lock()
+    
+    @property
+    def files(self) -> FileIndex:
+        """The shared file index, built on first use"""
+        if self._files is None:
+            self._files = FileIndex(self.root_dir)
+        return self._files
         
     def analyze(self) -> Dict:
         """Run all analysis checks"""
         print("🔍 Starting codebase analysis...\n")
+        started = time.perf_counter()
+        
+        # npm audit is the slowest step: let it run while the files are scanned
+        self.start_npm_audit()
+        
+        with self.timed("file_index"):
+            self.account(files=len(self.files.files))
+        
+        checks = [
+            self.check_security_issues,
+            self.check_git_issues,
+            self.check_python_issues,
+            self.check_typescript_issues,
+            self.check_documentation,
+            self.check_dependencies,
+            self.check_testing,
+        ]
         
-        self.check_security_issues()
-        self.check_git_issues()
-        self.check_python_issues()
-        self.check_typescript_issues()
-        self.check_documentation()
-        self.check_dependencies()
-        self.check_testing()
+        if self.jobs == 1:
+            for check in checks:
+                with self.timed(check.__name__):
+                    check()
+        else:
+            with ThreadPoolExecutor(self.jobs) as pool:
+                # Scan every source file up front, in parallel, then run the checks side by side
+                with self.timed("source_scan"):
+                    list(pool.map(self.scan, self.files.with_extension(".py") + self.files.with_extension(".ts")))
+                found = list(pool.map(self.collect_issues, checks))
+            
+            # Merged in check order, so the report matches a sequential run
+            for issues in found:
+                for severity, category, message in issues:
+                    self.add_issue(severity, category, message)
+        
+        if self.cache is not None:
+            self.stats["files_reused"] = self.cache.reused
+            self.stats["files_rescanned"] = self.cache.rescanned
+            self.cache.save()
+        
+        self.stats["timing"] = {
+            "total_seconds": round(time.perf_counter() - started, 4),
+            "checks": {
+                name.replace("check_", "", 1): dict(
+                    timing,
+                    seconds=round(timing["seconds"], 4),
+                    regex_seconds=round(timing["regex_seconds"], 4)
+                )
+                for name, timing in self.timings.items()
+            }
+        }
+        self.stats["slowest_files"] = [
+            {"path": path, "seconds": round(seconds, 4)}
+            for seconds, path in heapq.nlargest(SLOWEST_FILES, self._file_times)
+        ]
         
         return self.generate_report()
     
+    @contextmanager
+    def timed(self, name: str):
+        """Time a check; files, bytes and regex time spent inside it are credited to it too"""
+        timing = self.timings.setdefault(name, {"seconds": 0.0, "files": 0, "bytes_read": 0, "regex_seconds": 0.0})
+        previous = getattr(self._local, "timing", None)
+        self._local.timing = timing
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing["seconds"] += time.perf_counter() - started
+            self._local.timing = previous
+    
+    def account(self, files: int = 0, bytes_read: int = 0, regex_seconds: float = 0.0):
+        """Credit work to the running check (pool threads scanning ahead count as source_scan)"""
+        timing = getattr(self._local, "timing", None)
+        if timing is None:
+            timing = self.timings.setdefault("source_scan", {"seconds": 0.0, "files": 0, "bytes_read": 0, "regex_seconds": 0.0})
+        with self._timing_lock:
+            timing["files"] += files
+            timing["bytes_read"] += bytes_read
+            timing["regex_seconds"] += regex_seconds
+    
+    def scan(self, path: Path) -> Dict:
+        """Per-file facts for a source file, from the cache while it is unchanged"""
+        self.account(files=1)
+        facts = self._scans.get(path)
+        if facts is None:
+            scanner = scanner_for(extension_of(path.name))
+            started = time.perf_counter()
+            
+            def scan_source(content) -> Dict:
+                regex_started = time.perf_counter()
+                found = scanner.scan(content)
+                self.account(regex_seconds=time.perf_counter() - regex_started)
+                return found
+            
+            def rescan(known_digest: Optional[str]) -> Tuple[str, Optional[Dict]]:
+                with self.source(path) as content:
+                    data = content.encode("utf-8", "surrogatepass") if isinstance(content, str) else content
+                    digest = hashlib.sha1(data).hexdigest()
+                    return digest, scan_source(content) if digest != known_digest else None
+            
+            key = path.relative_to(self.root_dir).as_posix()
+            if self.cache is None:
+                with self.source(path) as content:
+                    facts = scan_source(content)
+            else:
+                stamp = [self.files.mtimes[path], self.files.sizes[path]]
+                facts = self.cache.lookup(key, stamp, rescan)["facts"]
+            self._scans[path] = facts
+            self._file_times.append((time.perf_counter() - started, key))
+        return facts
+    
+    @contextmanager
+    def source(self, path: Path):
+        """A file's text, or for a large file a read-only mmap of its bytes"""
+        size = self.files.sizes[path]
+        if size < MMAP_THRESHOLD:
+            if path not in self.files.contents:
+                self.account(bytes_read=size)
+            yield self.files.read(path)
+            return
+        
+        self.account(bytes_read=size)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            yield content
+    
+    def collect_issues(self, check) -> List[Tuple[str, str, str]]:
+        """Run one check, returning its issues instead of adding them to the report"""
+        self._local.issues = []
+        try:
+            with self.timed(check.__name__):
+                check()
+            return self._local.issues
+        finally:
+            self._local.issues = None
+    
     def check_security_issues(self):
         """Check for security vulnerabilities"""
         print("🔐 Checking security issues...")
@@ -47,41 +463,22 @@ class CodebaseAnalyzer:
                         self.add_issue("CRITICAL", "Security", ".env file not in .gitignore")
         
         # Check for hardcoded secrets in Python files
-        secret_patterns = [
-            r'api_key\s*=\s*["\'][\w-]+["\']',
-            r'password\s*=\s*["\'].+["\']',
-            r'secret\s*=\s*["\'].+["\']',
-            r'token\s*=\s*["\'].+["\']',
-        ]
-        
-        for py_file in self.root_dir.rglob("*.py"):
-            if "venv" in str(py_file) or "node_modules" in str(py_file):
-                continue
-            
-            with open(py_file, encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                for pattern in secret_patterns:
-                    if re.search(pattern, content, re.IGNORECASE):
-                        self.add_issue(
-                            "CRITICAL", 
-                            "Security",
-                            f"Potential hardcoded secret in {py_file.relative_to(self.root_dir)}"
-                        )
-                        break
+        for py_file in self.files.with_extension(".py"):
+            if self.scan(py_file)["secret"]:
+                self.add_issue(
+                    "CRITICAL", 
+                    "Security",
+                    f"Potential hardcoded secret in {py_file.relative_to(self.root_dir)}"
+                )
         
         # Check TypeScript/JavaScript files
-        for ts_file in self.root_dir.rglob("*.ts"):
-            if "node_modules" in str(ts_file):
-                continue
-                
-            with open(ts_file, encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                if re.search(r'apiKey\s*:\s*["\'][\w-]+["\']', content):
-                    self.add_issue(
-                        "CRITICAL",
-                        "Security", 
-                        f"Potential hardcoded API key in {ts_file.relative_to(self.root_dir)}"
-                    )
+        for ts_file in self.files.with_extension(".ts"):
+            if self.scan(ts_file)["api_key"]:
+                self.add_issue(
+                    "CRITICAL",
+                    "Security", 
+                    f"Potential hardcoded API key in {ts_file.relative_to(self.root_dir)}"
+                )
     
     def check_git_issues(self):
         """Check for Git-related issues"""
@@ -94,15 +491,15 @@ class CodebaseAnalyzer:
                 self.add_issue("HIGH", "Git", f"Temporary file {temp_file} committed to repository")
         
         # Check for large files
-        for file_path in self.root_dir.rglob("*"):
-            if file_path.is_file() and "node_modules" not in str(file_path):
-                size_mb = file_path.stat().st_size / (1024 * 1024)
-                if size_mb > 5:
-                    self.add_issue(
-                        "MEDIUM",
-                        "Git",
-                        f"Large file {file_path.relative_to(self.root_dir)} ({size_mb:.1f}MB) - consider Git LFS"
-                    )
+        self.account(files=len(self.files.sizes))
+        for file_path, size in self.files.sizes.items():
+            size_mb = size / (1024 * 1024)
+            if size_mb > 5:
+                self.add_issue(
+                    "MEDIUM",
+                    "Git",
+                    f"Large file {file_path.relative_to(self.root_dir)} ({size_mb:.1f}MB) - consider Git LFS"
+                )
         
         # Check gitignore completeness
         required_ignores = [
@@ -130,55 +527,46 @@ class CodebaseAnalyzer:
         
         # Check for requirements.txt
         if not (self.root_dir / "requirements.txt").exists():
-            py_files = list(self.root_dir.rglob("*.py"))
-            if py_files and not any("venv" in str(f) for f in py_files):
+            if self.files.with_extension(".py") and not self.files.virtualenvs:
                 self.add_issue("HIGH", "Python", "No requirements.txt found")
         
         # Check Python files
-        for py_file in self.root_dir.rglob("*.py"):
-            if "venv" in str(py_file) or "node_modules" in str(py_file):
-                continue
-            
-            with open(py_file, encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                lines = content.split('\n')
+        for py_file in self.files.with_extension(".py"):
+            facts = self.scan(py_file)
                 
-                # Check file size
-                if len(lines) > 500:
-                    self.add_issue(
-                        "MEDIUM",
-                        "Python",
-                        f"Large file {py_file.relative_to(self.root_dir)} ({len(lines)} lines)"
-                    )
+            # Check file size
+            if facts["lines"] > 500:
+                self.add_issue(
+                    "MEDIUM",
+                    "Python",
+                    f"Large file {py_file.relative_to(self.root_dir)} ({facts['lines']} lines)"
+                )
                 
-                # Check for bare except
-                if re.search(r'except\s*:', content):
-                    self.add_issue(
-                        "HIGH",
-                        "Python",
-                        f"Bare except clause in {py_file.relative_to(self.root_dir)}"
-                    )
+            # Check for bare except
+            if facts["bare_except"]:
+                self.add_issue(
+                    "HIGH",
+                    "Python",
+                    f"Bare except clause in {py_file.relative_to(self.root_dir)}"
+                )
+                
+            # Check for print statements (should use logging)
+            if len(facts["print"]) > 5:
+                self.add_issue(
+                    "MEDIUM",
+                    "Python",
+                    f"Many print statements in {py_file.relative_to(self.root_dir)} - use logging"
+                )
                 
-                # Check for print statements (should use logging)
-                print_count = len(re.findall(r'\bprint\s*\(', content))
-                if print_count > 5:
+            # Check for type hints
+            if facts["def"]:
+                type_coverage = len(facts["typed_def"]) / len(facts["def"]) * 100
+                if type_coverage < 50:
                     self.add_issue(
                         "MEDIUM",
                         "Python",
-                        f"Many print statements in {py_file.relative_to(self.root_dir)} - use logging"
+                        f"Low type hint coverage ({type_coverage:.0f}%) in {py_file.relative_to(self.root_dir)}"
                     )
-                
-                # Check for type hints
-                function_defs = re.findall(r'def\s+\w+\s*\([^)]*\)', content)
-                if function_defs:
-                    typed_functions = re.findall(r'def\s+\w+\s*\([^)]*\)\s*->', content)
-                    type_coverage = len(typed_functions) / len(function_defs) * 100
-                    if type_coverage < 50:
-                        self.add_issue(
-                            "MEDIUM",
-                            "Python",
-                            f"Low type hint coverage ({type_coverage:.0f}%) in {py_file.relative_to(self.root_dir)}"
-                        )
     
     def check_typescript_issues(self):
         """Check TypeScript code quality"""
@@ -203,32 +591,27 @@ class CodebaseAnalyzer:
         
         # Check TypeScript files
         any_type_count = 0
-        for ts_file in self.root_dir.rglob("*.ts"):
-            if "node_modules" in str(ts_file):
-                continue
-            
-            with open(ts_file, encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+        for ts_file in self.files.with_extension(".ts"):
+            facts = self.scan(ts_file)
                 
-                # Count 'any' usage
-                any_count = len(re.findall(r':\s*any\b', content))
-                any_type_count += any_count
+            # Count 'any' usage
+            any_count = len(facts["any"])
+            any_type_count += any_count
                 
-                if any_count > 5:
-                    self.add_issue(
-                        "HIGH",
-                        "TypeScript",
-                        f"Excessive 'any' usage ({any_count}) in {ts_file.relative_to(self.root_dir)}"
-                    )
+            if any_count > 5:
+                self.add_issue(
+                    "HIGH",
+                    "TypeScript",
+                    f"Excessive 'any' usage ({any_count}) in {ts_file.relative_to(self.root_dir)}"
+                )
                 
-                # Check for console.log
-                console_count = len(re.findall(r'console\.(log|debug|info)', content))
-                if console_count > 3:
-                    self.add_issue(
-                        "LOW",
-                        "TypeScript",
-                        f"Many console.log statements in {ts_file.relative_to(self.root_dir)}"
-                    )
+            # Check for console.log
+            if len(facts["console"]) > 3:
+                self.add_issue(
+                    "LOW",
+                    "TypeScript",
+                    f"Many console.log statements in {ts_file.relative_to(self.root_dir)}"
+                )
         
         self.stats["any_types"] = any_type_count
     
@@ -292,17 +675,14 @@ class CodebaseAnalyzer:
                     self.add_issue("CRITICAL", "Dependencies", "Invalid package.json")
         
         # Check npm audit
+        result = self.npm_audit_result()
+        if result is None:
+            return
+        
+        returncode, stdout = result
         try:
-            result = subprocess.run(
-                ["npm", "audit", "--json"],
-                cwd=self.root_dir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                audit_data = json.loads(result.stdout)
+            if returncode == 0:
+                audit_data = json.loads(stdout)
                 vulnerabilities = audit_data.get("metadata", {}).get("vulnerabilities", {})
                 
                 critical = vulnerabilities.get("critical", 0)
@@ -322,9 +702,81 @@ class CodebaseAnalyzer:
                         f"{high} high security vulnerabilities found"
                     )
                 
-        except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError):
+        except json.JSONDecodeError:
             pass
     
+    def lockfile_digest(self) -> str:
+        """What an npm audit result depends on in the tree"""
+        digest = hashlib.sha1()
+        for name in ["package.json", "package-lock.json", "yarn.lock"]:
+            path = self.root_dir / name
+            digest.update(name.encode() + (path.read_bytes() if path.exists() else b"-"))
+        return digest.hexdigest()
+    
+    def start_npm_audit(self):
+        """Start `npm audit` in the background; check_dependencies collects the result"""
+        if self._npm_audit is not None:
+            return
+        
+        if self.skip_npm_audit:
+            self._npm_audit = (None, 0)
+            self.stats["npm_audit"] = "skipped (--skip-npm-audit)"
+            return
+        
+        if self.cache is not None:
+            self._npm_audit_key = self.lockfile_digest()
+            cached = self.cache.npm_audit
+            # Only when asked for: a reused audit misses advisories published since it ran
+            if self.npm_audit_max_age is not None and cached and cached["lockfile"] == self._npm_audit_key:
+                age = time.time() - cached["at"]
+                if age < self.npm_audit_max_age:
+                    self._npm_audit = (None, 0)
+                    self._npm_audit_result = (cached["returncode"], cached["stdout"])
+                    self.stats["npm_audit"] = f"cached, {age / 3600:.1f}h old"
+                    print(f"📦 Reusing the npm audit of an unchanged lockfile from {age / 3600:.1f}h ago")
+                    return
+        
+        try:
+            process = subprocess.Popen(
+                ["npm", "audit", "--json"],
+                cwd=self.root_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+        except FileNotFoundError:
+            process = None
+            self.stats["npm_audit"] = "npm not found"
+        self._npm_audit = (process, time.monotonic() + NPM_AUDIT_TIMEOUT)
+    
+    def npm_audit_result(self) -> Optional[Tuple[int, str]]:
+        """(returncode, stdout) of `npm audit --json`, or None if it could not run in time"""
+        if self._npm_audit is None:
+            self.start_npm_audit()
+        process, deadline = self._npm_audit
+        if process is None or self._npm_audit_result is not None:
+            return self._npm_audit_result
+        
+        try:
+            stdout, _ = process.communicate(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            self.stats["npm_audit"] = f"timed out after {NPM_AUDIT_TIMEOUT}s"
+            return None
+        
+        self._npm_audit_result = (process.returncode, stdout)
+        self.stats["npm_audit"] = "ran"
+        if self.cache is not None and '"metadata"' in stdout:
+            # Only real audit reports are kept: a failed (e.g. offline) audit is retried next run
+            self.cache.npm_audit = {
+                "lockfile": self._npm_audit_key,
+                "at": time.time(),
+                "returncode": process.returncode,
+                "stdout": stdout
+            }
+        return self._npm_audit_result
+    
     def check_testing(self):
         """Check testing infrastructure"""
         print("🧪 Checking testing setup...")
@@ -337,9 +789,9 @@ class CodebaseAnalyzer:
             self.add_issue("CRITICAL", "Testing", "No test directory found")
         
         # Check for test files
-        test_files = list(self.root_dir.rglob("*.test.ts")) + \
-                    list(self.root_dir.rglob("*.test.tsx")) + \
-                    list(self.root_dir.rglob("test_*.py"))
+        test_files = self.files.matching(suffix=".test.ts") + \
+                    self.files.matching(suffix=".test.tsx") + \
+                    self.files.matching(prefix="test_", suffix=".py")
         
         if not test_files:
             self.add_issue("CRITICAL", "Testing", "No test files found")
@@ -353,11 +805,16 @@ class CodebaseAnalyzer:
         
         # Check for pytest config
         if not any((self.root_dir / f).exists() for f in ["pytest.ini", "pyproject.toml"]):
-            if list(self.root_dir.rglob("*.py")):
+            if self.files.with_extension(".py"):
                 self.add_issue("HIGH", "Testing", "No pytest configuration found")
     
     def add_issue(self, severity: str, category: str, message: str):
         """Add an issue to the report"""
+        collected = getattr(self._local, "issues", None)
+        if collected is not None:
+            collected.append((severity, category, message))
+            return
+        
         self.issues[severity].append({
             "category": category,
             "message": message
@@ -424,7 +881,9 @@ class CodebaseAnalyzer:
             print("📈 STATISTICS:")
             print("-" * 80)
             for key, value in report["stats"].items():
-                print(f"  {key}: {value}")
+                # Timing breakdowns are for --profile
+                if not isinstance(value, (dict, list)):
+                    print(f"  {key}: {value}")
         
         # Recommendations
         print("\n" + "="*80)
@@ -447,6 +906,23 @@ class CodebaseAnalyzer:
         
         print("\n" + "="*80 + "\n")
     
+    def print_profile(self, report: Dict):
+        """Print where the run's time went"""
+        timing = report["stats"]["timing"]
+        print("⏱️  PROFILE:")
+        print("-" * 80)
+        print(f"  {'step':<20} {'seconds':>9} {'files':>8} {'read (KB)':>10} {'regex (s)':>10}")
+        for name, step in sorted(timing["checks"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"  {name:<20} {step['seconds']:>9.3f} {step['files']:>8} "
+                  f"{step['bytes_read'] / 1024:>10.1f} {step['regex_seconds']:>10.3f}")
+        print(f"  {'total':<20} {timing['total_seconds']:>9.3f}")
+        
+        if report["stats"]["slowest_files"]:
+            print("\n  Slowest files:")
+            for entry in report["stats"]["slowest_files"]:
+                print(f"    {entry['seconds']:.4f}s  {entry['path']}")
+        print("\n" + "="*80 + "\n")
+    
     def save_report(self, report: Dict, filename: str = "codebase_analysis.json"):
         """Save report to JSON file"""
         with open(self.root_dir / filename, 'w') as f:
@@ -458,12 +934,44 @@ class CodebaseAnalyzer:
 def main():
     """Main execution"""
     import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Scan the codebase for common issues")
+    parser.add_argument("root_dir", nargs="?", default=".", help="project root (default: .)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="checks to run in parallel (default: 1; 0 = one per CPU)")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"rescan only files changed since the last run (cache: {CACHE_FILE})")
+    parser.add_argument("--skip-npm-audit", action="store_true",
+                        help="do not run npm audit (the report says so)")
+    parser.add_argument("--npm-audit-max-age", type=float, metavar="HOURS",
+                        help="with --incremental, reuse an audit of an unchanged lockfile up to this old "
+                             "(its age is reported; newer advisories are missed)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print a per-check timing breakdown and the slowest files")
+    parser.add_argument("--profile-output", metavar="FILE",
+                        help="also dump cProfile stats of the run to FILE (implies --profile; "
+                             "covers the main thread only, so best with --jobs 1)")
+    args = parser.parse_args()
     
-    root_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    if args.npm_audit_max_age is not None and not args.incremental:
+        parser.error("--npm-audit-max-age needs --incremental, whose cache keeps the audit")
     
-    analyzer = CodebaseAnalyzer(root_dir)
-    report = analyzer.analyze()
+    analyzer = CodebaseAnalyzer(args.root_dir, args.jobs or os.cpu_count() or 1, args.incremental,
+                                args.skip_npm_audit,
+                                args.npm_audit_max_age * 3600 if args.npm_audit_max_age is not None else None)
+    if args.profile_output:
+        import cProfile
+        profiler = cProfile.Profile()
+        report = profiler.runcall(analyzer.analyze)
+        profiler.dump_stats(args.profile_output)
+    else:
+        report = analyzer.analyze()
     analyzer.print_report(report)
+    if args.profile or args.profile_output:
+        analyzer.print_profile(report)
+        if args.profile_output:
+            print(f"🔬 cProfile stats saved to: {args.profile_output} (python -m pstats {args.profile_output})\n")
     analyzer.save_report(report)
     
     # Exit with error code if critical issues found
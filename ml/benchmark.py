@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Extractor benchmark and load test.
+
+    python benchmark.py micro [--sizes 30,1000,10000]
+    python benchmark.py load  [--duration 10 --concurrency 16 --train-ratio 0.05 --workers 1]
+    python benchmark.py startup [--corrections 100000]
+    python benchmark.py memory  [--corrections 100000]
+    python benchmark.py recall
+    python benchmark.py all   [--baseline old.json]
+
+The corpus is built from training_temp.json and the stored corrections,
+scaled up with synthetic variants. Results are written as JSON (--out) so
+runs can be compared; --baseline prints the change against an older run.
+Nothing here touches the real training_data.json: the load test runs the
+server against a temporary copy.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(BASE_DIR, "training_data.json")
+TEMP_FILE = os.path.join(BASE_DIR, "training_temp.json")
+
+# ==========================================
+# 1. CORPUS
+# ==========================================
+
+FILLERS = ["urgent sell", "box bill", "full kit", "no scratch", "💯", "5g", "dual sim", "exchange ok"]
+COLORS = ["black", "blue", "white", "green", "titanium", "purple"]
+
+def seed_texts() -> List[str]:
+    with open(TEMP_FILE) as f:
+        texts = [record["input"] for record in json.load(f)]
+    with open(DATA_FILE) as f:
+        texts += [c.get("raw_text") or k for k, c in json.load(f)["corrections"].items()]
+    return list(dict.fromkeys(t for t in texts if t.strip()))
+
+def variant(text: str, rnd: random.Random) -> str:
+    words = text.split()
+    op = rnd.randrange(6)
+    if op == 0 and words:
+        # Brand typo
+        w = words[0]
+        i = rnd.randrange(len(w))
+        words[0] = w[:i] + rnd.choice("aeiou") + w[i + 1:]
+    elif op == 1:
+        words = [str(rnd.randrange(8000, 150000, 500)) if w.isdigit() and len(w) >= 4 else w for w in words]
+    elif op == 2:
+        words.insert(rnd.randrange(1, len(words) + 1), rnd.choice(COLORS))
+    elif op == 3:
+        words.append(rnd.choice(FILLERS))
+    elif op == 4:
+        words.append(f"{rnd.choice([80, 85, 90, 95, 100])}%{rnd.choice(['bat', 'health', ' cond', ''])}")
+    else:
+        words = [w.upper() if rnd.random() < 0.3 else w for w in words]
+    return " ".join(words)
+
+def build_corpus(size: int, seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    base = seed_texts()
+    corpus = list(base)
+    while len(corpus) < size:
+        corpus.append(variant(rnd.choice(base), rnd))
+    return corpus[:size]
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples: return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000
+    }
+
+# ==========================================
+# 2. MICROBENCHMARKS
+# ==========================================
+
+def grown_knowledge(size: int, rnd: random.Random) -> Dict:
+    """The real brain padded with synthetic models/brands up to `size` models."""
+    with open(DATA_FILE) as f:
+        data = json.load(f)
+    suffixes = ["Pro", "Max", "Ultra", "Plus", "Lite", "Neo", "Fe", "5G", "Mini", "Edge", "Fold", "Note"]
+    models = list(dict.fromkeys(data["models"]))
+    seen = set(models)
+    while len(models) < size:
+        m = f"{rnd.choice('ASMXZNRGFCPKTV')}{rnd.randint(1, 199)} " + " ".join(rnd.sample(suffixes, rnd.randint(0, 2)))
+        m = m.strip()
+        if m not in seen:
+            seen.add(m)
+            models.append(m)
+    brands = dict(data["brands"])
+    while len(brands) < max(len(data["brands"]), size // 20):
+        alias = "".join(rnd.choice("ABCDEFGHIKLMNOPRSTUVXYZ") for _ in range(rnd.randint(3, 8)))
+        brands.setdefault(alias, alias.title())
+    return {"brands": brands, "models": models, "corrections": data["corrections"]}
+
+def time_calls(fn: Callable, items: List, min_seconds: float) -> Dict:
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while True:
+        for item in items:
+            t = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - t)
+        if time.perf_counter() >= deadline: break
+    total = sum(samples)
+    return {"calls_per_sec": len(samples) / total if total else 0.0, **percentiles(samples)}
+
+def run_micro(sizes: List[int], corpus_size: int, seconds: float) -> Dict:
+    sys.path.insert(0, BASE_DIR)
+    # Every call is handed its own snapshot: the import must not load, replay
+    # or compact the real brain, nor leave files next to it. The environment
+    # is restored afterwards, as the load test's server inherits it.
+    saved = dict(os.environ)
+    os.environ.update(EXTRACTOR_INIT_DB="0", KNOWLEDGE_STORE="json", PRICE_SKETCH_KEYS="0")
+    try:
+        import extractor_api as ea
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+    from knowledge_snapshot import KnowledgeSnapshot
+
+    rnd = random.Random(11)
+    corpus = build_corpus(corpus_size)
+    parser = ea.parser
+    words = [parser.tokenize(text)[0] for text in corpus]
+    results = {}
+    for size in sizes:
+        kb = KnowledgeSnapshot.from_dict(grown_knowledge(size, rnd))
+        print(f"⏱️  micro: {len(kb.model_index)} models, {len(kb.brands)} brands")
+        results[str(size)] = {
+            "models": len(kb.model_index),
+            "brands": len(kb.brands),
+            # parse_uncached: the full rule pipeline, bypassing recall and cache
+            "parse": time_calls(lambda t: parser.parse_uncached(t, kb=kb), corpus, seconds),
+            "detect_brand": time_calls(lambda w: parser.detect_brand(w[0] if w else "", kb=kb), words, seconds),
+            "extract_brand_model": time_calls(lambda w: parser.extract_brand_model(w, kb=kb), words, seconds)
+        }
+    return results
+
+PRICE_RE = re.compile(r"\b\d{3,}\b")
+
+def run_recall() -> Dict:
+    """Share of "same listing, new price" reposts the near-duplicate index finds."""
+    sys.path.insert(0, BASE_DIR)
+    from near_duplicates import NearDuplicateIndex
+
+    threshold = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+    rnd = random.Random(13)
+    base = [text.lower() for text in seed_texts() if PRICE_RE.search(text)]
+    index = NearDuplicateIndex(base)
+    found = 0
+    for text in base:
+        repost = PRICE_RE.sub(lambda m: str(int(m.group()) + rnd.randrange(1, 50) * 100), text)
+        found += text in {key for _, key in index.similar(repost, threshold)}
+    result = {"threshold": threshold, "listings": len(base), "recalled": found / len(base) if base else 0.0}
+    print(f"🔁 recall: {found}/{len(base)} price-changed reposts matched at {threshold}")
+    return result
+
+# ==========================================
+# 3. LOAD TEST
+# ==========================================
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def post(conn: http.client.HTTPConnection, path: str, body: Dict) -> int:
+    conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+def scratch_env(scratch: str, **overrides) -> Dict[str, str]:
+    """Environment for a server or probe that writes every file under `scratch`.
+
+    The journal and binary snapshot follow TRAINING_DATA_FILE; the other
+    side files are redirected one by one, so nothing lands next to the real brain.
+    """
+    return dict(os.environ,
+                TRAINING_DATA_FILE=os.path.join(scratch, "training_data.json"),
+                KNOWLEDGE_DB=os.path.join(scratch, "knowledge.db"),
+                PRICE_SKETCH_FILE=os.path.join(scratch, "price_sketches.json"),
+                SHADOW_REPORT_FILE=os.path.join(scratch, "shadow_report.json"),
+                SEARCH_LOG_FILE=os.path.join(scratch, "search_listings.jsonl"),
+                **overrides)
+
+def run_load(duration: float, concurrency: int, train_ratio: float, workers: int, store: str) -> Dict:
+    scratch = tempfile.mkdtemp(prefix="extractor-bench-")
+    port = free_port()
+    env = scratch_env(scratch, KNOWLEDGE_STORE=store)
+    shutil.copy(DATA_FILE, env["TRAINING_DATA_FILE"])
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "extractor_api:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                post(conn, "/extract", {"text": "warmup"})
+                conn.close()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not come up")
+                time.sleep(0.2)
+
+        corpus = build_corpus(5000)
+        with open(TEMP_FILE) as f:
+            lessons = json.load(f)
+        latencies = {"/extract": [], "/train": []}
+        failures = {"/extract": 0, "/train": 0}
+        lock = threading.Lock()
+        stop_at = time.perf_counter() + duration
+        print(f"🚚 load: {concurrency} clients, {train_ratio:.0%} /train, {workers} worker(s), {duration:.0f}s")
+
+        def client(seed: int):
+            rnd = random.Random(seed)
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            mine = {"/extract": [], "/train": []}
+            bad = {"/extract": 0, "/train": 0}
+            while time.perf_counter() < stop_at:
+                if rnd.random() < train_ratio:
+                    lesson = rnd.choice(lessons)
+                    path, body = "/train", {"raw_text": variant(lesson["input"], rnd), "corrected_data": lesson["data"]}
+                else:
+                    path, body = "/extract", {"text": rnd.choice(corpus)}
+                t = time.perf_counter()
+                try:
+                    ok = post(conn, path, body) == 200
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                if ok: mine[path].append(time.perf_counter() - t)
+                else: bad[path] += 1
+            with lock:
+                for path in latencies:
+                    latencies[path] += mine[path]
+                    failures[path] += bad[path]
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - started
+
+        done = sum(len(v) for v in latencies.values())
+        return {
+            "duration_s": elapsed,
+            "concurrency": concurrency,
+            "train_ratio": train_ratio,
+            "workers": workers,
+            "store": store,
+            "throughput_rps": done / elapsed,
+            "endpoints": {path: {"failures": failures[path], "rps": len(v) / elapsed, **percentiles(v)}
+                          for path, v in latencies.items()}
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+# ==========================================
+# 4. START-UP AND MEMORY
+# ==========================================
+
+STARTUP_PROBE = """
+import json, resource, sys, time
+t = time.perf_counter()
+import extractor_api
+imported = time.perf_counter()
+extractor_api.parser.parse(sys.argv[1])
+first = time.perf_counter()
+print(json.dumps({"import_ms": (imported - t) * 1000, "first_request_ms": (first - imported) * 1000,
+                  "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def synthetic_brain(corrections: int) -> Dict:
+    """The real brain with `corrections` synthetic listings taught on top."""
+    rnd = random.Random(5)
+    with open(DATA_FILE) as f:
+        data = json.load(f)
+    values = list(data["corrections"].values()) or [{"brand": "Unknown"}]
+    base, texts = seed_texts(), {}
+    while len(texts) < corrections:
+        text = variant(variant(rnd.choice(base), rnd), rnd)
+        texts.setdefault(text.lower(), text)
+    data["corrections"] = {key: dict(rnd.choice(values), raw_text=text) for key, text in texts.items()}
+    return data
+
+def run_startup(corrections: int) -> Dict:
+    """Import + first-request time of a fresh process, from JSON and from the binary snapshot."""
+    data = synthetic_brain(corrections)
+    scratch = tempfile.mkdtemp(prefix="extractor-bench-")
+    try:
+        brain = os.path.join(scratch, "training_data.json")
+        with open(brain, "w") as f:
+            json.dump(data, f)
+        print(f"🚀 startup: {len(data['corrections'])} corrections")
+        results = {"corrections": len(data["corrections"])}
+        # cold: no snapshot yet, so this start writes it; warm: the next start reads it
+        for case, snapshot in (("json", "0"), ("cold", "1"), ("warm", "1")):
+            env = scratch_env(scratch, KB_SNAPSHOT=snapshot, KNOWLEDGE_STORE="json")
+            out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, "iphone 12 mini 64gb 85% 21000"],
+                                 cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True).stdout
+            results[case] = json.loads(out.strip().splitlines()[-1])
+            print(f"  {case}: {results[case]['import_ms']:.0f} ms import, "
+                  f"{results[case]['first_request_ms']:.1f} ms first request")
+        return results
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+MEMORY_PROBE = """
+import json, sys, tracemalloc
+sys.path.insert(0, sys.argv[1])
+from compact_corrections import CompactCorrections
+with open(sys.argv[2]) as f:
+    text = f.read()
+tracemalloc.start()
+corrections = json.loads(text)
+as_dicts = tracemalloc.get_traced_memory()[0]
+compact = CompactCorrections.from_items(corrections.items())
+del corrections
+print(json.dumps({"dict_mb": as_dicts / 2 ** 20, "compact_mb": tracemalloc.get_traced_memory()[0] / 2 ** 20}))
+"""
+
+def run_memory(corrections: int) -> Dict:
+    """Heap held by the corrections as plain dicts and as CompactCorrections."""
+    scratch = tempfile.mkdtemp(prefix="extractor-bench-")
+    try:
+        path = os.path.join(scratch, "corrections.json")
+        with open(path, "w") as f:
+            json.dump(synthetic_brain(corrections)["corrections"], f)
+        # A fresh interpreter, so nothing else is on the traced heap
+        out = subprocess.run([sys.executable, "-c", MEMORY_PROBE, BASE_DIR, path],
+                             capture_output=True, text=True, check=True).stdout
+        result = {"corrections": corrections, **json.loads(out)}
+        print(f"🧮 memory: {corrections} corrections, {result['dict_mb']:.1f} MB as dicts, "
+              f"{result['compact_mb']:.1f} MB compact")
+        return result
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+# ==========================================
+# 5. REPORTING
+# ==========================================
+
+def flatten(tree: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in tree.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict): flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool): flat[name] = value
+    return flat
+
+def compare(report: Dict, baseline: Dict):
+    """Print every timing/throughput metric that moved by more than 5%."""
+    old, new = flatten(baseline), flatten(report)
+    print("\n📊 Change vs baseline (>5%):")
+    for name in sorted(set(old) & set(new)):
+        if not name.endswith(("_ms", "_per_sec", "_rps")) or not old[name]: continue
+        change = (new[name] - old[name]) / old[name] * 100
+        if abs(change) < 5: continue
+        better = change > 0 if name.endswith(("_per_sec", "_rps")) else change < 0
+        print(f"  {'🟢' if better else '🔴'} {name}: {old[name]:.3f} -> {new[name]:.3f} ({change:+.1f}%)")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the listing extractor")
+    ap.add_argument("mode", choices=["micro", "load", "startup", "memory", "recall", "all"])
+    ap.add_argument("--sizes", default="30,1000,10000", help="knowledge-base sizes (models) for micro mode")
+    ap.add_argument("--corpus", type=int, default=2000, help="listings in the micro corpus")
+    ap.add_argument("--seconds", type=float, default=1.0, help="minimum time per microbenchmark")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--train-ratio", type=float, default=0.05)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--store", choices=["json", "sqlite"], default="json")
+    ap.add_argument("--corrections", type=int, default=100000, help="stored corrections for startup/memory modes")
+    ap.add_argument("--out", default=os.path.join(BASE_DIR, "benchmark_results.json"))
+    ap.add_argument("--baseline", help="earlier results file to compare against")
+    args = ap.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        }
+    }
+    if args.mode in ("micro", "all"):
+        sizes = [int(s) for s in args.sizes.split(",")]
+        report["micro"] = run_micro(sizes, args.corpus, args.seconds)
+    if args.mode in ("load", "all"):
+        report["load"] = run_load(args.duration, args.concurrency, args.train_ratio, args.workers, args.store)
+    if args.mode in ("startup", "all"):
+        report["startup"] = run_startup(args.corrections)
+    if args.mode in ("memory", "all"):
+        report["memory"] = run_memory(args.corrections)
+    if args.mode in ("recall", "all"):
+        report["recall"] = run_recall()
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results saved to: {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
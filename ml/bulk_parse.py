@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Offline bulk parse of archived listings.
+
+    python bulk_parse.py listings.jsonl parsed.jsonl [--field text] [--workers 8]
+    python bulk_parse.py listings.csv parsed.jsonl --field title --resume
+
+Input is JSONL (a JSON string or an object holding --field per line) or
+CSV with a --field column. Output is JSONL, one parse per input row in
+input order; a row that cannot be parsed becomes {"raw_text", "error"}.
+
+Rows are read lazily and fanned out in chunks to a process pool, with a
+bounded number of chunks in flight, so memory stays flat however large
+the archive is. Output is written as chunks complete in order, and a
+checkpoint (output path + ".checkpoint") records how many rows and bytes
+are safely on disk; --resume truncates the output back to that point and
+skips the rows already done.
+
+With --index, the parsed listings are also appended to the server's
+search log (SEARCH_LOG_FILE), so /search covers the archive: running
+servers pick them up on their next search.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ==========================================
+# 1. INPUT
+# ==========================================
+
+def read_rows(path: str, fmt: str, field: str) -> Iterator:
+    """Listing texts, one per input row. Blank JSONL lines are not rows."""
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield row.get(field)
+            return
+        for line in f:
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield None  # reported as an error row, keeps the count aligned
+                continue
+            yield record.get(field) if isinstance(record, dict) else record
+
+def chunked(rows: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+# ==========================================
+# 2. WORKERS
+# ==========================================
+
+def init_worker(knowledge: Dict):
+    # One snapshot for the whole run, shipped once per process
+    sys.path.insert(0, BASE_DIR)
+    import extractor_api
+    from knowledge_snapshot import KnowledgeSnapshot
+    extractor_api.knowledge_base = KnowledgeSnapshot.from_dict(knowledge)
+    if extractor_api.learned: extractor_api.learned.retrain(extractor_api.knowledge_base)
+
+def parse_chunk(texts: List) -> str:
+    import extractor_api
+    lines = []
+    for text, entry in zip(texts, extractor_api.parser.parse_batch(texts)):
+        out = entry["result"] if "result" in entry else {"raw_text": text, "error": entry["error"]}
+        lines.append(json.dumps(out, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
+
+def index_chunk(search_log, texts: List, lines: str):
+    """Append a chunk's listings to the search log, keyed as /extract keys them."""
+    import extractor_api
+    items = []
+    for text, line in zip(texts, lines.split("\n")):
+        listing = json.loads(line)
+        if isinstance(text, str) and "error" not in listing:
+            items.append((extractor_api.parser.cache_key(text), listing))
+    search_log.append_many(items)
+
+# ==========================================
+# 3. CHECKPOINTS
+# ==========================================
+
+def load_checkpoint(path: str, args) -> Dict:
+    if not os.path.exists(path): return {"rows": 0, "bytes": 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != os.path.abspath(args.input):
+        sys.exit(f"❌ {path} belongs to a run over {checkpoint.get('input')}")
+    return checkpoint
+
+def save_checkpoint(path: str, out, args, rows: int):
+    from training_journal import write_atomic
+    out.flush()
+    os.fsync(out.fileno())
+    write_atomic(path, json.dumps({"input": os.path.abspath(args.input), "rows": rows, "bytes": out.tell()}))
+
+# ==========================================
+# 4. RUN
+# ==========================================
+
+def run(args) -> Dict:
+    # Set before the import, which forked workers inherit: a live server may
+    # own the journal, so nothing here replays it into DB_FILE or compacts it,
+    # and no process keeps per-stage metrics
+    os.environ["EXTRACTOR_INIT_DB"] = "0"
+    os.environ["EXTRACTOR_METRICS"] = "0"
+    sys.path.insert(0, BASE_DIR)
+    import extractor_api
+    knowledge = extractor_api.read_brain().to_dict()
+    search_log = extractor_api.search_log if args.index else None
+    if args.index and search_log is None: sys.exit("❌ --index needs SEARCH_INDEX_SIZE > 0 and a SEARCH_LOG_FILE")
+
+    checkpoint_file = args.output + ".checkpoint"
+    start = load_checkpoint(checkpoint_file, args) if args.resume else {"rows": 0, "bytes": 0}
+    if start["rows"]: print(f"↩️  Resuming after {start['rows']} rows")
+
+    rows = read_rows(args.input, args.format, args.field)
+    for _ in range(start["rows"]): next(rows, None)
+
+    out = open(args.output, "r+b" if start["bytes"] else "wb")
+    out.truncate(start["bytes"])
+    out.seek(start["bytes"])
+
+    done = start["rows"]
+    parsed = 0
+    started = last_report = last_checkpoint = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(knowledge,)) as pool:
+            in_flight = deque()
+
+            def drain_one():
+                nonlocal done, parsed, last_report, last_checkpoint
+                chunk, future = in_flight.popleft()
+                size = len(chunk)
+                text = future.result()
+                out.write(text.encode("utf-8"))
+                if search_log is not None: index_chunk(search_log, chunk, text)
+                done += size
+                parsed += size
+                now = time.perf_counter()
+                if now - last_checkpoint >= args.checkpoint_every:
+                    save_checkpoint(checkpoint_file, out, args, done)
+                    last_checkpoint = now
+                if now - last_report >= 5:
+                    print(f"  {done} rows, {parsed / (now - started):,.0f} rows/s", file=sys.stderr)
+                    last_report = now
+
+            for chunk in chunked(rows, args.chunk_size):
+                if len(in_flight) >= args.workers * 2: drain_one()
+                in_flight.append((chunk, pool.submit(parse_chunk, chunk)))
+            while in_flight: drain_one()
+        save_checkpoint(checkpoint_file, out, args, done)
+    finally:
+        out.close()
+
+    elapsed = time.perf_counter() - started
+    os.remove(checkpoint_file)
+    return {"rows": done, "parsed": parsed, "seconds": elapsed, "rows_per_sec": parsed / elapsed if elapsed else 0.0}
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-parse an archive of listings offline")
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--format", choices=["jsonl", "csv"], help="default: from the input extension")
+    ap.add_argument("--field", default="text", help="JSONL object key or CSV column holding the listing")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-size", type=int, default=1000)
+    ap.add_argument("--checkpoint-every", type=float, default=5.0, help="seconds between checkpoints")
+    ap.add_argument("--resume", action="store_true", help="continue from OUTPUT.checkpoint")
+    ap.add_argument("--index", action="store_true", help="also append the listings to the /search log")
+    args = ap.parse_args()
+    args.format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+
+    print(f"🚀 Parsing {args.input} on {args.workers} worker(s)")
+    summary = run(args)
+    print(f"✅ {summary['parsed']} rows in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_sec']:,.0f} rows/s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
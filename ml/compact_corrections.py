@@ -0,0 +1,265 @@
+import json
+from bisect import bisect_left
+from collections.abc import ItemsView, Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from zlib import crc32
+import numpy as np
+
+# ==========================================
+# COMPACT CORRECTIONS
+# ==========================================
+# A million corrections as plain dicts cost ~600 bytes each per worker:
+# a dict per record, a str per key and per raw_text, and the same brand
+# and model strings over and over. Here they are columns instead:
+#
+#   keys     one UTF-8 blob + offsets; looked up through a sorted array of
+#            CRC32s (binary search) and the row each belongs to
+#   records  per row, a run of uint32 codes: the record's field names, then
+#            each value, as positions in a pool of distinct values that is
+#            append-only and shared by every later store
+#   texts    raw_text is not pooled (it is unique per listing): it is marked
+#            SAME_AS_KEY when it equals the key, else kept in a second blob
+#
+# A lookup decodes a fresh dict, so callers may modify what they get.
+# Stores are immutable; merged() builds the next one by copying the arrays
+# and appending, which is what the copy-on-write LayeredMap folds into.
+# An overwritten key leaves its old record behind, so once those outnumber
+# the live ones the store is compacted: only referenced records are kept,
+# with a pool rebuilt from the values they use. The same arrays are what a
+# binary knowledge snapshot maps from disk, written compacted.
+
+TEXT_FIELD = "raw_text"
+SAME_AS_KEY = 0xFFFFFFFF
+IN_TEXTS = 0xFFFFFFFE
+JSON_FLAG = 0x80000000  # pooled as JSON text (lists, dicts): decoded anew on every read
+SCALARS = (str, int, float, bool, type(None))
+ARRAYS = {"key_offsets": np.uint64, "hashes": np.uint32, "order": np.uint32, "refs": np.uint32,
+          "record_offsets": np.uint64, "records": np.uint32, "text_offsets": np.uint64}
+
+
+class ValuePool:
+    """Distinct field values, each stored once; codes never change."""
+
+    def __init__(self, values: Iterable = ()):
+        self.values: List[Any] = list(values)
+        self.codes: Dict[Tuple[type, Any], int] = {(type(v), v): i for i, v in enumerate(self.values)}
+
+    def code(self, value) -> int:
+        if type(value) in SCALARS or isinstance(value, tuple):
+            key, flag = (type(value), value), 0
+        else:
+            key, flag = (str, json.dumps(value, separators=(",", ":"))), JSON_FLAG
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(key[1])
+        return code | flag
+
+
+class CompactItems(ItemsView):
+    def __iter__(self): return self._mapping.iter_items()
+
+
+class CompactCorrections(Mapping):
+    """Read-only corrections dict in columnar form."""
+
+    def __init__(self, pool: ValuePool, keys: bytes, texts: bytes, **arrays: np.ndarray):
+        self.pool = pool
+        self.keys_blob = keys
+        self.texts = texts
+        self.key_offsets = arrays["key_offsets"]
+        self.hashes = arrays["hashes"]  # sorted
+        self.order = arrays["order"]  # row of each hash
+        self.refs = arrays["refs"]  # record of each row
+        self.record_offsets = arrays["record_offsets"]
+        self.records = arrays["records"]
+        self.text_offsets = arrays["text_offsets"]  # one text span per record
+        self.count = len(self.refs)
+        # Lookups index through memoryviews: plain ints, none of numpy's per-call overhead
+        self.views = {name: memoryview(arrays[name]).cast("B").cast("Q" if ARRAYS[name] is np.uint64 else "I")
+                      for name in ARRAYS}
+
+    @classmethod
+    def empty(cls, pool: ValuePool = None) -> "CompactCorrections":
+        zero = np.zeros(1, dtype=np.uint64)
+        none = np.zeros(0, dtype=np.uint32)
+        return cls(pool or ValuePool(), b"", b"", key_offsets=zero, hashes=none, order=none, refs=none,
+                   record_offsets=zero, records=none, text_offsets=zero)
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, Dict]]) -> "CompactCorrections":
+        return cls.empty().merged(dict(items))
+
+    # --- Storage ---
+
+    def to_sections(self) -> Dict[str, bytes]:
+        sections = {name: np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes()
+                    for name, dtype in ARRAYS.items()}
+        sections.update(keys=bytes(self.keys_blob), texts=bytes(self.texts),
+                        pool=json.dumps(self.pool.values).encode())
+        return sections
+
+    @classmethod
+    def from_sections(cls, sections: Dict[str, memoryview]) -> "CompactCorrections":
+        """A store over buffers written by to_sections, used in place."""
+        arrays = {name: np.frombuffer(sections[name], dtype=dtype) for name, dtype in ARRAYS.items()}
+        # Lists in the pool are field-name tuples: other lists are pooled as JSON text
+        values = [tuple(v) if isinstance(v, list) else v for v in json.loads(bytes(sections["pool"]))]
+        return cls(ValuePool(values), sections["keys"], sections["texts"], **arrays)
+
+    # --- Reads ---
+
+    def key_at(self, row: int) -> str:
+        offsets = self.views["key_offsets"]
+        return str(self.keys_blob[offsets[row]:offsets[row + 1]], "utf-8", "surrogatepass")
+
+    def find(self, raw: bytes, digest: int) -> int:
+        views = self.views
+        hashes, order, offsets = views["hashes"], views["order"], views["key_offsets"]
+        i = bisect_left(hashes, digest)
+        while i < self.count and hashes[i] == digest:
+            row = order[i]
+            if self.keys_blob[offsets[row]:offsets[row + 1]] == raw: return row
+            i += 1
+        return -1
+
+    def row_of(self, key) -> int:
+        if not isinstance(key, str) or not self.count: return -1
+        raw = key.encode("utf-8", "surrogatepass")
+        return self.find(raw, crc32(raw))
+
+    def record(self, index: int, key: str) -> Dict:
+        views = self.views
+        offsets = views["record_offsets"]
+        codes = views["records"][offsets[index]:offsets[index + 1]].tolist()
+        values = self.pool.values
+        out = {}
+        for field, code in zip(values[codes[0]], codes[1:]):
+            if code == SAME_AS_KEY: out[field] = key
+            elif code == IN_TEXTS:
+                texts = views["text_offsets"]
+                out[field] = str(self.texts[texts[index]:texts[index + 1]], "utf-8", "surrogatepass")
+            elif code & JSON_FLAG: out[field] = json.loads(values[code ^ JSON_FLAG])
+            else: out[field] = values[code]
+        return out
+
+    def __getitem__(self, key):
+        row = self.row_of(key)
+        if row < 0: raise KeyError(key)
+        return self.record(self.views["refs"][row], key)
+
+    def get(self, key, default=None):
+        row = self.row_of(key)
+        return self.record(self.views["refs"][row], key) if row >= 0 else default
+
+    def __contains__(self, key): return self.row_of(key) >= 0
+
+    def __len__(self): return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        offsets, blob = self.key_offsets.tolist(), self.keys_blob
+        for start, end in zip(offsets, offsets[1:]): yield str(blob[start:end], "utf-8", "surrogatepass")
+
+    def items(self) -> CompactItems: return CompactItems(self)
+
+    def dead_records(self) -> int:
+        """Records no row refers to any more: left behind by overwritten keys."""
+        return len(self.record_offsets) - 1 - self.count
+
+    def iter_items(self) -> Iterator[Tuple[str, Dict]]:
+        # Row order, without a hash lookup per key
+        for key, index in zip(self, self.refs.tolist()): yield key, self.record(index, key)
+
+    # --- Writes ---
+
+    def merged(self, updates: Dict[str, Dict]) -> "CompactCorrections":
+        """A new store with `updates` applied; existing keys keep their position, as in a dict."""
+        pool = self.pool
+        code = pool.code
+        refs = self.refs.copy()
+        new_keys, new_hashes, new_refs = [], [], []
+        codes, record_sizes, texts, text_sizes = [], [], [], []
+        first_record = len(self.record_offsets) - 1
+        for key, value in updates.items():
+            raw = key.encode("utf-8", "surrogatepass")
+            digest = crc32(raw)
+            record = first_record + len(record_sizes)
+            row = self.find(raw, digest) if self.count else -1
+            if row >= 0: refs[row] = record
+            else:
+                new_keys.append(raw)
+                new_hashes.append(digest)
+                new_refs.append(record)
+
+            size, text = len(codes), b""
+            codes.append(code(tuple(value)))
+            for field, v in value.items():
+                if field == TEXT_FIELD and type(v) is str:
+                    if v == key: codes.append(SAME_AS_KEY)
+                    else:
+                        text = v.encode("utf-8", "surrogatepass")
+                        codes.append(IN_TEXTS)
+                else: codes.append(code(v))
+            record_sizes.append(len(codes) - size)
+            texts.append(text)
+            text_sizes.append(len(text))
+
+        def extend(offsets: np.ndarray, sizes: List[int]) -> np.ndarray:
+            return np.concatenate((offsets, offsets[-1] + np.cumsum(sizes, dtype=np.uint64)))
+
+        # New keys go into the hash order with one sorted insert
+        added = np.array(new_hashes, dtype=np.uint32)
+        by_hash = np.argsort(added, kind="stable")
+        at = self.hashes.searchsorted(added[by_hash], "right")
+        rows = np.arange(self.count, self.count + len(added), dtype=np.uint32)[by_hash]
+        store = CompactCorrections(
+            pool,
+            bytes(self.keys_blob) + b"".join(new_keys),
+            bytes(self.texts) + b"".join(texts),
+            key_offsets=extend(self.key_offsets, [len(k) for k in new_keys]),
+            hashes=np.insert(self.hashes, at, added[by_hash]),
+            order=np.insert(self.order, at, rows),
+            refs=np.concatenate((refs, np.array(new_refs, dtype=np.uint32))),
+            record_offsets=extend(self.record_offsets, record_sizes),
+            records=np.concatenate((self.records, np.array(codes, dtype=np.uint32))),
+            text_offsets=extend(self.text_offsets, text_sizes)
+        )
+        return store.compacted() if store.dead_records() > store.count else store
+
+    def compacted(self) -> "CompactCorrections":
+        """The same store holding only the records its rows refer to, over a pool of just their values."""
+        rows = self.refs.astype(np.int64)
+
+        def gather(offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            # Positions of every row's span, in row order, and the new offsets
+            offsets = offsets.astype(np.int64)
+            starts = offsets[rows]
+            sizes = offsets[rows + 1] - starts
+            new_offsets = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(sizes)))
+            at = np.arange(new_offsets[-1]) + np.repeat(starts - new_offsets[:-1], sizes)
+            return at, new_offsets.astype(np.uint64)
+
+        at, record_offsets = gather(self.record_offsets)
+        records = self.records[at]
+        at, text_offsets = gather(self.text_offsets)
+        texts = np.frombuffer(self.texts, dtype=np.uint8)[at].tobytes()
+
+        pooled = (records != SAME_AS_KEY) & (records != IN_TEXTS)
+        codes = records[pooled]
+        flags = codes & np.uint32(JSON_FLAG)
+        codes = codes ^ flags
+        used = np.unique(codes)
+        records[pooled] = np.searchsorted(used, codes).astype(np.uint32) | flags
+        values = self.pool.values
+        return CompactCorrections(
+            ValuePool(values[code] for code in used.tolist()),
+            self.keys_blob,
+            texts,
+            key_offsets=self.key_offsets,
+            hashes=self.hashes,
+            order=self.order,
+            refs=np.arange(self.count, dtype=np.uint32),
+            record_offsets=record_offsets,
+            records=records,
+            text_offsets=text_offsets
+        )
@@ -1,16 +1,53 @@
 import re
+import atexit
 import json
 import os
+import threading
 import uvicorn
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import Optional, Dict, List
-from difflib import get_close_matches
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import AfterValidator, BaseModel
+from typing import Annotated, Optional, Dict, List, Any, Literal, NamedTuple, Tuple
+from knowledge_snapshot import KnowledgeSnapshot
+from listing_search import ListingIndex, ListingLog
+from listing_segmenter import ListingSegmenter
+from metrics import Metrics, NO_LAPS
+from micro_batcher import MicroBatcher
+from near_duplicates import words as shingle_words
+from price_sketch import PriceSketches
+from shadow_mode import ShadowRunner
+from parse_cache import ParseCache
+from sqlite_store import SqliteKnowledgeStore
+import snapshot_file
+from training_journal import TrainingJournal, write_atomic
 
-app = FastAPI(title="Smart Mobile Extractor v4")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replay the listing log in the background: /search answers from what is indexed meanwhile
+    if search_log is not None: threading.Thread(target=search_log.sync, args=(True,), daemon=True).start()
+    yield
+    # uvicorn ends a worker by re-raising SIGTERM, which skips atexit: the
+    # last prices this worker saw are merged into the shared file here
+    if price_sketches is not None: await run_in_threadpool(flush_price_sketches)
+
+app = FastAPI(title="Smart Mobile Extractor v4", lifespan=lifespan)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, "training_data.json")
+DB_FILE = os.environ.get("TRAINING_DATA_FILE", os.path.join(BASE_DIR, "training_data.json"))
+JOURNAL_FILE = os.path.splitext(DB_FILE)[0] + ".journal"
+# "sqlite" shares one brain between uvicorn workers; "json" keeps it per process
+KNOWLEDGE_STORE = os.environ.get("KNOWLEDGE_STORE", "json")
+SQLITE_FILE = os.environ.get("KNOWLEDGE_DB", os.path.join(BASE_DIR, "knowledge.db"))
+TEMP_FILE = os.path.join(BASE_DIR, "training_temp.json")
+# Binary twin of DB_FILE with its lookup indexes prebuilt, loaded by memory map (KB_SNAPSHOT=0 = off)
+KB_SNAPSHOT_FILE = os.path.splitext(DB_FILE)[0] + ".kbsnap" if os.environ.get("KB_SNAPSHOT", "1") != "0" else None
+# Reposts at least this similar to a taught listing reuse its correction (0 = off)
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+
+# Stage/endpoint/persist latency histograms for /metrics; EXTRACTOR_METRICS=0 turns them off
+metrics = Metrics(os.environ.get("EXTRACTOR_METRICS", "1") != "0")
 
 initial_knowledge = {
     "brands": {"IPHONE": "Apple", "SAM": "Samsung", "PIXEL": "Google", "1+": "OnePlus"},
@@ -18,63 +55,285 @@ initial_knowledge = {
     "corrections": {}
 }
 
-knowledge_base = initial_knowledge
+# Current immutable snapshot; /train swaps in the next one (see knowledge_snapshot.py)
+knowledge_base = KnowledgeSnapshot.from_dict(initial_knowledge)
+parse_cache = ParseCache(int(os.environ.get("PARSE_CACHE_SIZE", "10000")))
+# Extracted listings for /search, oldest dropped past SEARCH_INDEX_SIZE (0 = off), at
+# roughly 0.5 KB each in every worker. They go through SEARCH_LOG_FILE, which all
+# workers append to and index from, so each searches what any of them extracted,
+# across restarts; bulk_parse.py --index backfills it from an archive. With
+# SEARCH_LOG_FILE="" each worker indexes only what it extracted since it started.
+SEARCH_INDEX_SIZE = int(os.environ.get("SEARCH_INDEX_SIZE", "50000"))
+SEARCH_LOG_FILE = os.environ.get("SEARCH_LOG_FILE", os.path.join(BASE_DIR, "search_listings.jsonl"))
+search_index = ListingIndex(SEARCH_INDEX_SIZE) if SEARCH_INDEX_SIZE > 0 else None
+search_log = ListingLog(SEARCH_LOG_FILE, search_index) if search_index is not None and SEARCH_LOG_FILE else None
+# Asking-price sketches per phone for /prices/stats, at most PRICE_SKETCH_KEYS of them (0 = off).
+# Workers fold theirs into PRICE_SKETCH_FILE every PRICE_SKETCH_FLUSH_SECONDS and on exit.
+PRICE_SKETCH_KEYS = int(os.environ.get("PRICE_SKETCH_KEYS", "20000"))
+PRICE_SKETCH_FILE = os.environ.get("PRICE_SKETCH_FILE", os.path.join(BASE_DIR, "price_sketches.json"))
+price_sketches = PriceSketches(PRICE_SKETCH_FILE, PRICE_SKETCH_KEYS,
+                               float(os.environ.get("PRICE_SKETCH_FLUSH_SECONDS", "30"))) if PRICE_SKETCH_KEYS > 0 else None
 
-def init_db():
+# /train appends to the journal; snapshots are folded in by compaction
+journal = TrainingJournal(DB_FILE, JOURNAL_FILE, int(os.environ.get("JOURNAL_COMPACT_EVERY", "500")))
+# Single writer: held while the next snapshot is built and swapped in
+brain_lock = threading.Lock()
+
+store = SqliteKnowledgeStore(SQLITE_FILE) if KNOWLEDGE_STORE == "sqlite" else None
+store_version = 0  # last shared-store record reflected in knowledge_base
+
+# Optional learned brand/model engine (LEARNED_ENGINE=1, needs scikit-learn).
+# Each brand and each of the LEARNED_MAX_PAIRS most frequent (brand, model)
+# pairs costs 512 KiB of weights per worker: 128 pairs is ~64 MB
+learned = None
+if os.environ.get("LEARNED_ENGINE", "0") == "1":
+    from learned_engine import LearnedEngine  # scikit-learn is slow to import: only when asked for
+    learned = LearnedEngine(TEMP_FILE, float(os.environ.get("LEARNED_MIN_CONFIDENCE", "0.6")),
+                            max_pairs=int(os.environ.get("LEARNED_MAX_PAIRS", "128")))
+    if not learned.available:
+        print("⚠️ LEARNED_ENGINE needs scikit-learn and numpy; using the rule path only")
+        learned = None
+
+def learn(raw_text: str, corrected_data: Dict):
+    """Publish the next snapshot with one correction applied. Hold brain_lock."""
+    learn_many([(raw_text, corrected_data)])
+
+def learn_many(records: List[Tuple[str, Dict]]):
+    """Publish the next snapshot with all records applied at once. Hold brain_lock."""
     global knowledge_base
-    if os.path.exists(DB_FILE):
-        try:
-            with open(DB_FILE, "r") as f:
-                data = json.load(f)
-                # Fix missing keys if migrating
-                if "models" not in data: data["models"] = []
-                if "brands" not in data: data["brands"] = initial_knowledge["brands"]
-                if "corrections" not in data: data["corrections"] = {}
-                knowledge_base = data
-        except:
-            save_brain()
+    if not records: return
+    knowledge_base = knowledge_base.learn_many(records)
+    if learned: learned.schedule(knowledge_base)
+
+def read_db_file() -> Dict:
+    if not os.path.exists(DB_FILE): return initial_knowledge
+    # Snapshots are only ever replaced atomically, so a parse error here
+    # is real damage and must not be papered over with an empty brain.
+    with open(DB_FILE, "r") as f:
+        data = json.load(f)
+    # Fix missing keys if migrating
+    if "models" not in data: data["models"] = []
+    if "brands" not in data: data["brands"] = initial_knowledge["brands"]
+    if "corrections" not in data: data["corrections"] = {}
+    return data
+
+def init_db():
+    global knowledge_base, store_version
+    loaded = load_kb_snapshot()
+    if loaded is not None:
+        knowledge_base = loaded
     else:
-        save_brain()
+        if os.path.exists(DB_FILE): stamp = snapshot_file.source_stamp(DB_FILE)
+        knowledge_base = KnowledgeSnapshot.from_dict(read_db_file(), knowledge_base.version + 1)
+        if not os.path.exists(DB_FILE): save_brain()
+        # Pay for the indexes once, here, rather than on the first request of every start
+        elif write_kb_snapshot(knowledge_base, stamp): knowledge_base = load_kb_snapshot() or knowledge_base
 
+    replayed = [(record["raw_text"], record["corrected_data"]) for record in journal.replay()]
+    learn_many(replayed)
+    if replayed: compact_brain()
+
+    if store is not None:
+        # The JSON brain only seeds a fresh store; from then on SQLite rules
+        store.seed(knowledge_base.to_dict())
+        data, store_version = store.load()
+        knowledge_base = KnowledgeSnapshot.from_dict(data, knowledge_base.version + 1)
+    if learned: learned.schedule(knowledge_base)
+
+def read_brain() -> KnowledgeSnapshot:
+    """The brain init_db would start from, without writing anything.
+
+    For offline readers (bulk_parse.py) running beside a live server: the
+    journal is replayed in memory, never compacted, and the shared store is
+    only read once it has been seeded.
+    """
+    kb = load_kb_snapshot() or KnowledgeSnapshot.from_dict(read_db_file(), knowledge_base.version + 1)
+    kb = kb.learn_many([(record["raw_text"], record["corrected_data"]) for record in journal.replay()])
+    if store is not None and store.seeded(): kb = KnowledgeSnapshot.from_dict(store.load()[0], kb.version + 1)
+    return kb
+
+def sync_knowledge(wait: bool = False):
+    """Catch up with /train records other workers committed to the store.
+
+    Readers call this without waiting: if another thread is already
+    catching up they keep parsing with the snapshot they have.
+    """
+    global knowledge_base, store_version
+    if store is None or store.version() == store_version: return
+    if not brain_lock.acquire(blocking=wait): return
+    try:
+        changes = store.changes_since(store_version)
+        if changes is None:
+            data, store_version = store.load()
+            knowledge_base = KnowledgeSnapshot.from_dict(data, knowledge_base.version + 1)
+            if learned: learned.schedule(knowledge_base)
+            return
+        learn_many([(raw_text, corrected_data) for _, raw_text, corrected_data in changes])
+        if changes: store_version = changes[-1][0]
+    finally:
+        brain_lock.release()
+
+# Every write of DB_FILE holds journal.compact_lock until its binary twin is
+# written too, so the stamp taken right after the write is of that write and
+# never of a newer DB_FILE the snapshot does not mirror
 def save_brain():
-    with open(DB_FILE, "w") as f:
-        json.dump(knowledge_base, f, indent=4)
+    kb = knowledge_base
+    with journal.compact_lock:
+        with metrics.timed("extractor_persist_seconds", "save_brain"):
+            write_atomic(DB_FILE, json.dumps(kb.to_dict(), indent=4))
+        write_kb_snapshot(kb, snapshot_file.source_stamp(DB_FILE))
+
+def compact_brain():
+    """Fold the journal into a fresh snapshot."""
+    # Only the snapshot reference is taken under the lock; it never changes
+    # afterwards, so serialising it can happen outside.
+    render = lambda kb: json.dumps(kb.to_dict(), indent=4)
+    persisted = lambda kb: write_kb_snapshot(kb, snapshot_file.source_stamp(DB_FILE))
+    with metrics.timed("extractor_persist_seconds", "compact"):
+        journal.compact(lambda: knowledge_base, render, brain_lock, persisted)
+
+# The binary snapshot is rewritten with DB_FILE and stamped with the
+# DB_FILE it mirrors; a stale one is never loaded, only replaced
+kb_snapshot_lock = threading.Lock()
+
+def load_kb_snapshot() -> Optional[KnowledgeSnapshot]:
+    if KB_SNAPSHOT_FILE is None: return None
+    try:
+        with metrics.timed("extractor_persist_seconds", "kb_snapshot_load"):
+            return snapshot_file.load(KB_SNAPSHOT_FILE, DB_FILE, knowledge_base.version + 1)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable {KB_SNAPSHOT_FILE}: {e}")
+        return None
+
+def write_kb_snapshot(kb: KnowledgeSnapshot, stamp: List[int]) -> bool:
+    if KB_SNAPSHOT_FILE is None: return False
+    try:
+        with kb_snapshot_lock, metrics.timed("extractor_persist_seconds", "kb_snapshot_write"):
+            snapshot_file.write(KB_SNAPSHOT_FILE, kb, stamp)
+        return True
+    except Exception as e:
+        # The JSON is the source of truth; without its twin we only start slower
+        print(f"⚠️ Could not write {KB_SNAPSHOT_FILE}: {e}")
+        return False
 
-init_db()
+# Bulk-parse workers are handed a snapshot instead and must not replay or
+# compact the journal themselves (see bulk_parse.py)
+if os.environ.get("EXTRACTOR_INIT_DB", "1") != "0": init_db()
 
 # ==========================================
 # 2. PARSER LOGIC
 # ==========================================
 
+# One scan splits a listing into digit runs, whitespace, the '/' and '%'
+# separators, and any other text.
+LEXEME_RE = re.compile(r'(\d+)|(\s+)|([/%])|([^\d\s/%]+)')
+NO_LEXEME = ("", "", "", "")
+
+BATTERY_WORDS = ("BAT", "HEALTH", "🔋")
+CONDITION_WORDS = ("COND", "KIT")
+
+class Token(NamedTuple):
+    kind: str          # "number", "unit" (8GB), "ratio" (8/128) or "percent" (99%)
+    digits: str        # the digit run as written
+    bounded: bool      # not glued to letters, i.e. a standalone number
+    value: Any = None  # unit: "GB", ratio: (left, right), percent: (n, "BAT" | "COND" | None)
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
 class ListingParser:
     def __init__(self):
         self.common_ram = {4, 6, 8, 12, 16, 18, 24}
         self.common_storage = {32, 64, 128, 256, 512, 1024}
 
-    def clean_text(self, text: str) -> str:
-        text = re.sub(r'([/%])', r' \1 ', text)
-        return text.strip()
+    def tokenize(self, raw_text: str) -> Tuple[List[str], List[Token]]:
+        """Split a listing into words and typed number tokens in one scan.
+
+        '/' and '%' always stand as words of their own. A digit run only
+        forms a ratio or a percentage when it touches the separator.
+        """
+        lexemes = LEXEME_RE.findall(raw_text)
+        n = len(lexemes)
+        words, tokens, word = [], [], ""
+        for i, (num, ws, sym, text) in enumerate(lexemes):
+            if not num:
+                if text:
+                    word += text
+                    continue
+                if word: words.append(word); word = ""
+                if sym: words.append(sym)
+                continue
+            word += num
 
-    def detect_brand(self, first_word: str):
+            prev = lexemes[i - 1][3] if i else ""
+            nxt = lexemes[i + 1] if i + 1 < n else NO_LEXEME
+            bounded = not (prev and _is_word_char(prev.upper()[-1])) and \
+                      not (nxt[3] and _is_word_char(nxt[3].upper()[0]))
+
+            # What follows the digits, skipping at most one whitespace run
+            j = i + 2 if nxt[1] else i + 1
+            gap = len(nxt[1])
+            after = lexemes[j] if j < n else NO_LEXEME
+
+            kind, value = "number", None
+            if after[3] and gap <= 1 and after[3].upper().startswith("GB"):
+                kind, value = "unit", "GB"
+            elif after[2] and not gap:
+                k = j + 2 if j + 1 < n and lexemes[j + 1][1] else j + 1
+                touching = k == j + 1
+                follow = lexemes[k] if k < n else NO_LEXEME
+                if after[2] == "/":
+                    if touching and len(follow[0]) >= 2:
+                        kind, value = "ratio", (int(num[-2:]), int(follow[0][:4]))
+                elif len(num) >= 2:
+                    qualifier = None
+                    if touching and follow[3]:
+                        up = follow[3].upper()
+                        if up.startswith(BATTERY_WORDS): qualifier = "BAT"
+                        elif up.startswith(CONDITION_WORDS): qualifier = "COND"
+                    kind, value = "percent", (int(num[-3:]), qualifier)
+            tokens.append(Token(kind, num, bounded, value))
+        if word: words.append(word)
+        return words, tokens
+
+    def detect_brand(self, first_word: str, memo: Optional[Dict] = None, kb: Optional[KnowledgeSnapshot] = None):
+        kb = kb or knowledge_base
         clean = first_word.upper()
-        if clean in knowledge_base["brands"]: return knowledge_base["brands"][clean]
+        if memo is not None:
+            # Batch path: each distinct first word is resolved once per batch
+            if clean not in memo: memo[clean] = self.detect_brand(clean, kb=kb)
+            return memo[clean]
+        brand = kb.brands.get(clean)
+        if brand is not None: return brand
         
-        matches = get_close_matches(clean, knowledge_base["brands"].keys(), n=1, cutoff=0.7)
-        return knowledge_base["brands"][matches[0]] if matches else "Unknown"
+        match = kb.brand_index.best_match(clean, cutoff=0.7)
+        return kb.brands[match] if match else "Unknown"
 
-    def extract_brand_model(self, words: List[str]):
+    def match_model(self, model: str, memo: Optional[Dict] = None, kb: Optional[KnowledgeSnapshot] = None):
+        kb = kb or knowledge_base
+        if memo is not None:
+            if model not in memo: memo[model] = self.match_model(model, kb=kb)
+            return memo[model]
+        if len(kb.model_index):
+            match = kb.model_index.best_match(model, cutoff=0.6)
+            if match: return match
+        return model
+
+    def extract_brand_model(self, words: List[str], memo: Optional[Dict] = None, kb: Optional[KnowledgeSnapshot] = None, laps=NO_LAPS):
+        kb = kb or knowledge_base
         brand = "Unknown"
         if words:
-            brand = self.detect_brand(words[0])
+            brand = self.detect_brand(words[0], memo["brands"] if memo else None, kb)
             if brand == "Unknown": brand = words[0].title()
+        laps.lap("brand")
 
         model_tokens = []
         for i, w in enumerate(words[1:]):
             # STOP CONDITIONS
             w_up = w.upper()
             
-            # 1. Explicit Specs (GB, %, /)
-            if "GB" in w_up or "%" in w_up or re.search(r'\d+/\d+', w): break
+            # 1. Explicit Specs (GB, %)
+            if "GB" in w_up or "%" in w_up: break
             
             # 2. Numbers check
             if w.isdigit():
@@ -102,42 +361,104 @@ class ListingParser:
         model = " ".join(model_tokens).title()
         
         # Apply Learning
-        if knowledge_base["models"]:
-            matches = get_close_matches(model, knowledge_base["models"], n=1, cutoff=0.6)
-            if matches: model = matches[0]
+        model = self.match_model(model, memo["models"] if memo else None, kb)
+        laps.lap("model")
 
         return brand, model
 
-    def parse(self, raw_text: str):
+    def cache_key(self, raw_text: str) -> str:
+        # Case and surrounding whitespace never change an ASCII parse
+        key = raw_text.strip()
+        return key.lower() if key.isascii() else key
+
+    def parse(self, raw_text: str, memo: Optional[Dict] = None, kb: Optional[KnowledgeSnapshot] = None):
+        # One snapshot for the whole parse, whatever /train does meanwhile
+        kb = kb or knowledge_base
+        laps = metrics.stages()
+
         # Recall
-        key = raw_text.strip().lower()
-        if key in knowledge_base["corrections"]: return knowledge_base["corrections"][key]
+        correction = kb.corrections.get(raw_text.strip().lower())
+        laps.lap("recall")
+        if correction is not None: return correction
+
+        # The learned model is pinned like the snapshot; a retrain is a new generation
+        engine = memo["engine"] if memo and "engine" in memo else learned and learned.current
+        generation = (kb.version, engine.version) if engine else kb.version
+
+        cache_key = self.cache_key(raw_text)
+        cached = parse_cache.get(cache_key, generation)
+        laps.lap("cache")
+        if cached is not None: return dict(cached, raw_text=raw_text)
+
+        result = self.recall_similar(raw_text, kb, laps) or self.parse_uncached(raw_text, memo, kb, laps, engine)
+        parse_cache.put(cache_key, dict(result), generation)
+        return result
+
+    def recall_similar(self, raw_text: str, kb: KnowledgeSnapshot, laps=NO_LAPS) -> Optional[Dict]:
+        """A taught correction for a near-identical listing, specs refreshed.
+
+        Brand and model come from the correction. A spec field is re-read
+        from this listing only where it differs from the taught listing.
+        """
+        if not NEAR_DUPLICATE_THRESHOLD or not len(kb.corrections): return None
+        query = raw_text.strip().lower()
+        present = set(shingle_words(query))
+        result = None
+        for _, key in kb.near_index.similar(query, NEAR_DUPLICATE_THRESHOLD):
+            correction = kb.corrections.get(key)
+            if correction is None: continue  # taught after this snapshot
+            # Words that named the brand/model in the taught listing must still be here
+            named = shingle_words(f"{correction.get('brand') or ''} {correction.get('model') or ''}")
+            if not set(named).intersection(shingle_words(key)) <= present: continue
+
+            taught = self.extract_specs(self.tokenize(correction.get("raw_text") or key)[1])
+            now = self.extract_specs(self.tokenize(raw_text)[1])
+            result = dict(correction, raw_text=raw_text)
+            for field, value in now.items():
+                if value != taught[field]: result[field] = value
+            break
+        laps.lap("near_recall")
+        return result
+
+    def parse_uncached(self, raw_text: str, memo: Optional[Dict] = None, kb: Optional[KnowledgeSnapshot] = None, laps=None, engine=None):
+        kb = kb or knowledge_base
+        laps = laps or metrics.stages()
+        words, tokens = self.tokenize(raw_text)
+        laps.lap("tokenize")
+
+        brand, model = self.extract_brand_model(words, memo, kb, laps)
 
-        clean = self.clean_text(raw_text)
-        words = clean.split()
-        upper = clean.upper()
+        if engine:
+            # Confident learned guesses override the rules, field by field
+            guess = memo["guesses"].get(raw_text) if memo and "guesses" in memo else None
+            learned_brand, learned_model = guess or learned.predict([raw_text], engine)[0]
+            if learned_brand: brand = learned_brand
+            if learned_model: model = learned_model
+            laps.lap("learned")
 
-        brand, model = self.extract_brand_model(words)
+        specs = self.extract_specs(tokens, laps)
+        return {"raw_text": raw_text, "brand": brand, "model": model, **specs}
 
+    def extract_specs(self, tokens: List[Token], laps=NO_LAPS) -> Dict:
         # --- EXTRACT SPECS (Improved) ---
         ram, storage = None, None
         
         # Priority 1: Slash (8/128)
-        slash = re.search(r'(\d{1,2})\s?/\s?(\d{2,4})', upper)
+        slash = next((t.value for t in tokens if t.kind == "ratio"), None)
         
         # Priority 2: Explicit GB (8GB 128GB)
-        gbs = sorted([int(x) for x in re.findall(r'(\d+)\s?GB', upper)], reverse=True)
+        gbs = sorted([int(t.digits) for t in tokens if t.kind == "unit"], reverse=True)
 
-        # Priority 3: Loose Numbers (8 256) -> THE FIX
-        loose_nums = [int(x) for x in re.findall(r'\b(\d+)\b', upper)]
-        
         if slash:
-            v1, v2 = int(slash.group(1)), int(slash.group(2))
+            v1, v2 = slash
             ram, storage = (v1, v2) if v1 < v2 else (v2, v1)
         elif gbs:
             storage = gbs[0]
             if len(gbs) > 1: ram = gbs[1]
         else:
+            # Priority 3: Loose Numbers (8 256) -> THE FIX
+            loose_nums = [int(t.digits) for t in tokens if t.bounded]
+
             # Try to find a valid RAM+Storage pair in the loose numbers
             # We look for a pattern where a RAM-sized number is followed by a Storage-sized number
             for i in range(len(loose_nums) - 1):
@@ -155,36 +476,38 @@ class ListingParser:
                     storage = n1
                     break
 
+        laps.lap("specs")
+
         # --- EXTRACT REST ---
-        battery, condition, price = None, None, None
+        price = None
+        percents = [t.value for t in tokens if t.kind == "percent"]
         
-        batt = re.search(r'(\d{2,3})\s?%\s?(?:BAT|HEALTH|🔋)', upper)
-        if batt: battery = int(batt.group(1))
-
-        cond = re.search(r'(\d{2,3})\s?%\s?(?:COND|KIT)', upper)
-        if cond: condition = int(cond.group(1))
+        battery = next((p for p, q in percents if q == "BAT"), None)
+        condition = next((p for p, q in percents if q == "COND"), None)
         
         # Fallback Percentage
         if not battery and not condition:
-            percents = [int(x) for x in re.findall(r'(\d{2,3})\s?%', upper)]
-            for p in percents:
+            for p, _ in percents:
                 if p==100 and not condition: condition=100
                 elif p<100 and not battery: battery=p
         
         # Price (exclude RAM/Storage numbers we just found to avoid confusion)
-        # Create a text string WITHOUT the found specs to search for price safely
-        price_text = upper
-        if ram: price_text = price_text.replace(str(ram), "", 1)
-        if storage: price_text = price_text.replace(str(storage), "", 1)
+        # Drop the first occurrence of each found spec from the digit runs
+        runs = [t.digits for t in tokens]
+        for spec in (ram, storage):
+            if not spec: continue
+            spec = str(spec)
+            for i, run in enumerate(runs):
+                if spec in run:
+                    runs[i] = run.replace(spec, "", 1)
+                    break
         
-        # Look for remaining big numbers
-        nums = [int(x) for x in re.findall(r'\b\d{4,7}\b', price_text)]
+        # Look for remaining big standalone numbers
+        nums = [int(run) for run, t in zip(runs, tokens) if t.bounded and 4 <= len(run) <= 7]
         if nums: price = max(nums)
+        laps.lap("price")
 
         return {
-            "raw_text": raw_text,
-            "brand": brand,
-            "model": model,
             "ram_gb": ram,
             "storage_gb": storage,
             "battery_percent": battery,
@@ -192,34 +515,292 @@ class ListingParser:
             "price": price
         }
 
+    def parse_batch(self, texts: List[Any]):
+        # Work shared across the batch: repeated lines are parsed once and
+        # brand/model fuzzy lookups are memoised for the whole batch, which
+        # is pinned to one snapshot so the memo can never go stale.
+        kb = knowledge_base
+        memo = {"brands": {}, "models": {}}
+        engine = learned and learned.current
+        if engine:
+            # One vectorised prediction for every listing recall won't answer
+            todo = [t for t in dict.fromkeys(t for t in texts if isinstance(t, str))
+                    if kb.corrections.get(t.strip().lower()) is None]
+            memo["engine"] = engine
+            memo["guesses"] = dict(zip(todo, learned.predict(todo, engine)))
+        seen = {}
+        results = []
+        for i, text in enumerate(texts):
+            if not isinstance(text, str):
+                results.append({"index": i, "error": "text must be a string"})
+                continue
+            try:
+                if text not in seen: seen[text] = self.parse(text, memo, kb)
+                results.append({"index": i, "result": seen[text]})
+            except Exception as e:
+                results.append({"index": i, "error": str(e)})
+        return results
+
+    def parse_stream(self, blob: str):
+        """Each listing of a multi-listing paste, parsed as soon as it has been cut out."""
+        kb = knowledge_base
+        memo = {"brands": {}, "models": {}}
+        segmenter = ListingSegmenter(self.tokenize, lambda word: kb.brands.get(word.upper()) is not None)
+        for i, segment in enumerate(segmenter.split(blob)):
+            try:
+                yield {"index": i, "line": segment.line, "result": self.parse(segment.text, memo, kb)}
+            except Exception as e:
+                yield {"index": i, "line": segment.line, "raw_text": segment.text, "error": str(e)}
+
 parser = ListingParser()
 
+# Shadow mode (SHADOW_PARSER=module:Class, a ListingParser subclass): the
+# candidate re-parses a SHADOW_SAMPLE_RATE share of /extract traffic next
+# to the live parser in a background thread, never on the request path
+def load_shadow() -> Optional[ShadowRunner]:
+    spec = os.environ.get("SHADOW_PARSER")
+    if not spec: return None
+    import importlib
+    module, _, name = spec.partition(":")
+    candidate = getattr(importlib.import_module(module), name)()
+    engine = lambda: learned and learned.current
+    return ShadowRunner(
+        lambda text, kb: parser.parse_uncached(text, None, kb, NO_LAPS, engine()),
+        lambda text, kb: candidate.parse_uncached(text, None, kb, NO_LAPS, engine()),
+        spec,
+        float(os.environ.get("SHADOW_SAMPLE_RATE", "0.05")),
+        int(os.environ.get("SHADOW_QUEUE_SIZE", "1000")),
+        os.environ.get("SHADOW_REPORT_FILE", os.path.join(BASE_DIR, "shadow_report.json")),
+        float(os.environ.get("SHADOW_REPORT_SECONDS", "60")))
+
+shadow = load_shadow()
+
 # ==========================================
 # 3. ENDPOINTS
 # ==========================================
 
-class InputData(BaseModel): text: str
-class TrainingData(BaseModel): raw_text: str; corrected_data: Dict
+class InputData(BaseModel): text: str; listing_id: Optional[str] = None
+class BatchInputData(BaseModel): texts: List[Any]; listing_ids: Optional[List[Optional[str]]] = None
+
+def not_blank(value: str) -> str:
+    if not value.strip(): raise ValueError("text is empty")
+    return value
+
+# Listing text a correction is learned from: a blank one would be stored under
+# the key "", so /train and /train/bulk answer 422 (the latter with the record's index in `loc`)
+TrainingText = Annotated[str, AfterValidator(not_blank)]
+
+class TrainingData(BaseModel): raw_text: TrainingText; corrected_data: Dict
+# One record of a labelling-team file (training_temp.json)
+class LabelledListing(BaseModel): input: TrainingText; fixed_brand: Optional[str] = None; data: Dict
+
+def extract_many(texts: List[Any]):
+    sync_knowledge()
+    return parser.parse_batch(texts)
+
+def record_listing(listing_id: Optional[str], text: str, result: Dict):
+    # Reposts of the same text without an id collapse into one listing
+    if search_log is not None: search_log.append(listing_id or parser.cache_key(text), result)
+    elif search_index is not None: search_index.add(listing_id or parser.cache_key(text), result)
+    if price_sketches is not None: price_sketches.add(result)
+
+def flush_price_sketches():
+    with metrics.timed("extractor_persist_seconds", "price_sketch_flush"):
+        price_sketches.flush()
+
+def maybe_flush_price_sketches():
+    if price_sketches is not None and price_sketches.flush_due():
+        threading.Thread(target=flush_price_sketches, daemon=True).start()
+
+# Fallback for exits that never shut the app down (scripts, plain interpreter exit)
+if price_sketches is not None: atexit.register(price_sketches.flush)
+
+# /extract parses and records in a worker thread, never on the event loop:
+# the search index and price sketches take locks that /extract/batch holds
+# for a whole batch
+def extract_one(text: str, listing_id: Optional[str] = None):
+    sync_knowledge()
+    result = parser.parse(text)
+    record_listing(listing_id, text, result)
+    if shadow is not None: shadow.offer(text, knowledge_base)
+    return result
+
+def extract_queued(items: List[tuple]):
+    """Batcher handler: `items` are (text, listing_id) pairs."""
+    results = extract_many([text for text, _ in items])
+    for entry in results:
+        if "result" in entry:
+            text, listing_id = items[entry["index"]]
+            record_listing(listing_id, text, entry["result"])
+            if shadow is not None: shadow.offer(text, knowledge_base)
+    return results
+
+# Micro-batching for /extract: a window of EXTRACT_BATCH_WINDOW_MS (0 = off)
+# or EXTRACT_BATCH_MAX queued calls, whichever fills first
+BATCH_WINDOW_MS = float(os.environ.get("EXTRACT_BATCH_WINDOW_MS", "0"))
+extract_batcher = MicroBatcher(extract_queued, int(os.environ.get("EXTRACT_BATCH_MAX", "64")),
+                               BATCH_WINDOW_MS / 1000) if BATCH_WINDOW_MS > 0 else None
 
 @app.post("/extract")
-def extract_endpoint(data: InputData): return parser.parse(data.text)
+async def extract_endpoint(data: InputData):
+    with metrics.timed("extractor_request_seconds", "/extract"):
+        if extract_batcher is not None: result = await extract_batcher.submit((data.text, data.listing_id))
+        else: result = await run_in_threadpool(extract_one, data.text, data.listing_id)
+        maybe_flush_price_sketches()
+        return result
+
+@app.post("/extract/batch")
+def extract_batch_endpoint(data: BatchInputData):
+    with metrics.timed("extractor_request_seconds", "/extract/batch"):
+        results = extract_many(data.texts)
+        ids = data.listing_ids or []
+        for entry in results:
+            if "result" in entry:
+                i = entry["index"]
+                record_listing(ids[i] if i < len(ids) else None, data.texts[i], entry["result"])
+                if shadow is not None: shadow.offer(data.texts[i], knowledge_base)
+        maybe_flush_price_sketches()
+        return {"results": results}
+
+@app.post("/extract/stream")
+def extract_stream_endpoint(data: InputData):
+    """A pasted broadcast split into listings: one NDJSON line per listing, sent as it is parsed.
+
+    With a listing_id, listing i is recorded as "<listing_id>#<i>".
+    """
+    sync_knowledge()
+
+    def lines():
+        with metrics.timed("extractor_request_seconds", "/extract/stream"):
+            for entry in parser.parse_stream(data.text):
+                if "result" in entry:
+                    listing_id = f"{data.listing_id}#{entry['index']}" if data.listing_id else None
+                    record_listing(listing_id, entry["result"]["raw_text"], entry["result"])
+                yield json.dumps(entry, ensure_ascii=False) + "\n"
+        maybe_flush_price_sketches()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/search")
+def search_endpoint(q: str = "", brand: Optional[str] = None, model: Optional[str] = None,
+                    ram_gb: Optional[int] = None, storage_gb: Optional[int] = None,
+                    min_price: Optional[float] = None, max_price: Optional[float] = None,
+                    min_battery: Optional[int] = None, max_battery: Optional[int] = None,
+                    sort: Literal["recent", "price_asc", "price_desc"] = "recent",
+                    offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100)):
+    """Listings seen by /extract: every word of q plus the given fields and ranges."""
+    if search_index is None: return {"enabled": False, "total": 0, "offset": offset, "limit": limit, "results": []}
+    with metrics.timed("extractor_request_seconds", "/search"):
+        if search_log is not None: search_log.sync()
+        return search_index.search(
+            q,
+            {"brand": brand, "model": model, "ram_gb": ram_gb, "storage_gb": storage_gb},
+            {"price": (min_price, max_price), "battery": (min_battery, max_battery)},
+            sort, offset, limit)
+
+@app.get("/prices/stats")
+def price_stats_endpoint(brand: str, model: str, storage_gb: Optional[int] = None, price: Optional[float] = None,
+                         min_samples: int = Query(20, ge=1)):
+    """Asking-price percentiles for a phone seen by /extract; with `price`, its rank and outlier flag."""
+    if price_sketches is None: return {"enabled": False}
+    with metrics.timed("extractor_request_seconds", "/prices/stats"):
+        return price_sketches.stats(brand, model, storage_gb, price, min_samples)
+
+@app.get("/search/stats")
+def search_stats_endpoint(): return search_index.stats() if search_index else {"enabled": False}
+
+@app.get("/extract/batcher/stats")
+def batcher_stats_endpoint(): return extract_batcher.stats() if extract_batcher else {"enabled": False}
+
+@app.get("/learned/stats")
+def learned_stats_endpoint(): return learned.stats() if learned else {"enabled": False}
+
+@app.get("/shadow/stats")
+def shadow_stats_endpoint(): return shadow.stats() if shadow else {"enabled": False}
+
+@app.post("/shadow/replay")
+def shadow_replay_endpoint():
+    """Score both parsers against every stored correction, in the background; see /shadow/stats."""
+    if shadow is None: return {"enabled": False}
+    return {"status": "started" if shadow.start_replay(knowledge_base) else "already running",
+            "corrections": len(knowledge_base.corrections)}
+
+@app.get("/cache/stats")
+def cache_stats_endpoint(): return {"generation": knowledge_base.version, **parse_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    kb = knowledge_base
+    sizes = {"brands": len(kb.brands), "models": len(kb.model_index), "corrections": len(kb.corrections)}
+    gauges = [("extractor_knowledge_entries", "Entries in the current knowledge snapshot", {"kind": kind}, n)
+              for kind, n in sizes.items()]
+    gauges.append(("extractor_knowledge_version", "Version of the current knowledge snapshot", {}, kb.version))
+    cache = parse_cache.stats()
+    for name in ("hits", "misses", "evictions", "stale"):
+        gauges.append(("extractor_parse_cache_events_total", "Parse cache lookups by outcome", {"event": name}, cache[name]))
+    gauges.append(("extractor_parse_cache_size", "Parses held in the cache", {}, cache["size"]))
+    if search_index is not None:
+        gauges.append(("extractor_search_listings", "Listings in the search index", {}, len(search_index)))
+    if price_sketches is not None:
+        gauges.append(("extractor_price_sketches", "Price sketches held (brand/model/storage keys)", {}, len(price_sketches)))
+    if extract_batcher is not None:
+        batcher = extract_batcher.stats()
+        gauges.append(("extractor_batcher_batches_total", "Micro-batches dispatched", {}, batcher["batches"]))
+        gauges.append(("extractor_batcher_items_total", "Items dispatched in micro-batches", {}, batcher["items"]))
+        gauges.append(("extractor_batcher_queue_depth", "Items waiting for the next micro-batch", {}, batcher["queue_depth"]))
+    if shadow is not None:
+        gauges.append(("extractor_shadow_samples_total", "Listings re-parsed by the shadow parser", {}, shadow.live.samples))
+        gauges.append(("extractor_shadow_disagreements_total", "Shadow samples where the parsers disagreed", {}, shadow.live.disagreements))
+        gauges.append(("extractor_shadow_dropped_total", "Shadow samples dropped on a full queue", {}, shadow.dropped))
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
 
 @app.post("/train")
 def train_endpoint(data: TrainingData):
-    key = data.raw_text.strip().lower()
-    knowledge_base["corrections"][key] = data.corrected_data
-    
-    brand = data.corrected_data.get("brand")
-    if brand and brand != "Unknown":
-        knowledge_base["brands"][data.raw_text.split()[0].upper()] = brand
-        knowledge_base["brands"][brand.upper()] = brand
-        
-    model = data.corrected_data.get("model")
-    if model and model not in knowledge_base["models"]:
-        knowledge_base["models"].append(model)
-        
-    save_brain()
-    return {"status": "Learned"}
+    with metrics.timed("extractor_request_seconds", "/train"):
+        if store is not None:
+            # Committed for every worker; ours applies it in log order
+            with metrics.timed("extractor_persist_seconds", "sqlite_record"):
+                store.record(data.raw_text, data.corrected_data)
+            sync_knowledge(wait=True)
+            return {"status": "Learned"}
+
+        with brain_lock:
+            learn(data.raw_text, data.corrected_data)
+            with metrics.timed("extractor_persist_seconds", "journal_append"):
+                journal.append({"raw_text": data.raw_text, "corrected_data": data.corrected_data})
+        if journal.compaction_due():
+            threading.Thread(target=compact_brain, daemon=True).start()
+        return {"status": "Learned"}
+
+def labelled_records(listings: List[LabelledListing]) -> List[Tuple[str, Dict]]:
+    """(raw_text, corrected_data) for labelled listings; fixed_brand fills a missing brand."""
+    records = []
+    for listing in listings:
+        data = listing.data
+        if listing.fixed_brand and data.get("brand") in (None, "", "Unknown"):
+            data = dict(data, brand=listing.fixed_brand)
+        records.append((listing.input, data))
+    return records
+
+def train_bulk(records: List[Tuple[str, Dict]]) -> Dict:
+    """Apply a whole correction file as one new snapshot, persisted once."""
+    with metrics.timed("extractor_request_seconds", "/train/bulk"):
+        if store is not None:
+            with metrics.timed("extractor_persist_seconds", "sqlite_record_many"):
+                store.record_many(records)
+            sync_knowledge(wait=True)
+        elif records:
+            with brain_lock:
+                learn_many(records)
+            # Compaction writes the snapshot with these records and retires the journal
+            # behind them; until it returns the client has no acknowledgement
+            compact_brain()
+        kb = knowledge_base
+        return {"status": "Learned", "records": len(records), "corrections": len(kb.corrections),
+                "models": len(kb.model_index), "brands": len(kb.brands)}
+
+@app.post("/train/bulk")
+def train_bulk_endpoint(listings: List[LabelledListing]):
+    return train_bulk(labelled_records(listings))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
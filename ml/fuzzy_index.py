@@ -0,0 +1,149 @@
+from collections import Counter
+from difflib import SequenceMatcher
+from math import ceil
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# ==========================================
+# INDEXED FUZZY MATCHER
+# ==========================================
+# Drop-in replacement for get_close_matches(word, entries, n=1, cutoff).
+#
+# SequenceMatcher.ratio() is 2*M / (len(a) + len(b)) and the M matched
+# characters can never exceed the characters both strings share. Entries are
+# bucketed by length and indexed by (char, copy number). Only entries whose
+# bound reaches the bar are checked with a real SequenceMatcher, best bound
+# first, and the bar rises from the cutoff to the best ratio found so far:
+#
+#   * a trigram index picks the few entries sharing the most trigrams with
+#     the word and checks them first, so the bar is usually high at once;
+#   * length buckets are visited closest first and the scan stops at the
+#     first whose length alone cannot reach the bar (real_quick_ratio);
+#   * within a bucket, an entry sharing `need` characters with the word
+#     holds one of any len(word) - need + 1 of its (char, copy) tokens, so
+#     only the postings of the rarest ones are read (count filtering), and
+#     the shared count is taken for those candidates alone (quick_ratio).
+#
+# Trigrams only choose what is checked first; the character bound decides
+# what may be skipped, so the answer is identical to difflib's and a lookup
+# reads a bounded slice of the postings rather than every entry.
+
+TRIGRAM = 3
+PROBES = 8  # entries sharing the most trigrams, checked before the scan
+
+
+def _char_tokens(text: str) -> List[Tuple[str, int]]:
+    # "AAB" -> [("A", 1), ("A", 2), ("B", 1)]: the k-th copy of a character
+    seen = Counter()
+    tokens = []
+    for ch in text:
+        seen[ch] += 1
+        tokens.append((ch, seen[ch]))
+    return tokens
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+class FuzzyIndex:
+    def __init__(self, entries: Iterable[str] = ()):
+        self.entries: List[str] = []
+        self.ids: Dict[str, int] = {}
+        # length -> (char, k) -> ids of entries of that length holding >= k copies
+        self.postings: Dict[int, Dict[Tuple[str, int], Set[int]]] = {}
+        # trigram -> ids of the entries containing it
+        self.trigrams: Dict[str, Set[int]] = {}
+        for entry in entries: self.add(entry)
+
+    def __len__(self): return len(self.entries)
+
+    def __contains__(self, entry): return entry in self.ids
+
+    def add(self, entry: str):
+        """Index one entry. Called incrementally by /train."""
+        if entry in self.ids: return
+        idx = len(self.entries)
+        self.entries.append(entry)
+        self.ids[entry] = idx
+        by_token = self.postings.setdefault(len(entry), {})
+        for token in _char_tokens(entry):
+            by_token.setdefault(token, set()).add(idx)
+        for gram in _trigrams(entry):
+            self.trigrams.setdefault(gram, set()).add(idx)
+
+    def _probe(self, word: str, cutoff: float) -> List[int]:
+        """Ids of the entries of a reachable length sharing the most trigrams with the word."""
+        shared = Counter()
+        for gram in _trigrams(word):
+            ids = self.trigrams.get(gram)
+            if ids: shared.update(ids)
+        la = len(word)
+        probes = []
+        for idx, _ in shared.most_common():
+            lb = len(self.entries[idx])
+            if 2.0 * min(la, lb) / (la + lb) < cutoff: continue
+            probes.append(idx)
+            if len(probes) == PROBES: break
+        return probes
+
+    def _candidates(self, tokens: List[Tuple[str, int]], lb: int, bar: float) -> List[Tuple[float, int]]:
+        """(upper bound on ratio, id) for every entry of length lb that can reach the bar."""
+        la = len(tokens)
+        total = la + lb
+        by_token = self.postings[lb]
+        need = ceil(bar * total / 2.0 - 1e-9)
+        if need <= 0:
+            ids = set().union(*by_token.values()) if lb else {self.ids[""]}
+            return [(2.0 * min(la, lb) / total if total else 1.0, idx) for idx in ids]
+
+        # Count filter: tokens no entry holds are free picks
+        rarest = sorted(tokens, key=lambda token: len(by_token.get(token, ())))[:la - need + 1]
+        candidates = set().union(*(by_token.get(token, ()) for token in rarest))
+        if not candidates: return []
+        # quick_ratio: characters shared with the word bound the matched ones
+        shared = Counter()
+        for token in tokens:
+            ids = by_token.get(token)
+            if ids: shared.update(ids & candidates)
+        return [(2.0 * n / total, idx) for idx, n in shared.items() if n >= need]
+
+    def best_match(self, word: str, cutoff: float = 0.6) -> Optional[str]:
+        """Same result as get_close_matches(word, entries, n=1, cutoff) or None."""
+        best = self.best_scored(word, cutoff)
+        return best[1] if best else None
+
+    def best_scored(self, word: str, cutoff: float = 0.6) -> Optional[Tuple[float, str]]:
+        """(ratio, entry) of the best match, comparable across indexes."""
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+        # Only the word itself scores 1.0, so an exact entry always wins
+        if word in self.ids: return (1.0, word)
+
+        # Mirror difflib exactly: seq2 is the word, seq1 the candidate, and
+        # ties are broken by the larger string, as heapq.nlargest does. An
+        # entry whose bound merely equals the best ratio can still win a tie,
+        # so the bar only ever excludes bounds below it.
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        best = None
+
+        def check(idx: int):
+            nonlocal best
+            x = self.entries[idx]
+            s.set_seq1(x)
+            if s.real_quick_ratio() >= cutoff and s.quick_ratio() >= cutoff and s.ratio() >= cutoff:
+                scored = (s.ratio(), x)
+                if best is None or scored > best: best = scored
+
+        for idx in self._probe(word, cutoff): check(idx)
+
+        la = len(word)
+        tokens = _char_tokens(word)
+        length_bound = lambda lb: 2.0 * min(la, lb) / (la + lb) if la + lb else 1.0
+        for lb in sorted(self.postings, key=length_bound, reverse=True):
+            bar = max(cutoff, best[0]) if best else cutoff
+            if length_bound(lb) < bar: break
+            for bound, idx in sorted(self._candidates(tokens, lb, bar), reverse=True):
+                if best is not None and bound < best[0]: break
+                check(idx)
+        return best
@@ -0,0 +1,171 @@
+from math import isqrt
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from compact_corrections import CompactCorrections
+from fuzzy_index import FuzzyIndex
+from near_duplicates import NearDuplicateIndex
+
+# ==========================================
+# COPY-ON-WRITE KNOWLEDGE BASE
+# ==========================================
+# Readers grab the current KnowledgeSnapshot once and use it for the whole
+# request. Snapshots are never mutated: /train builds the next one from the
+# previous and the module global is rebound in one step, so a reader sees a
+# correction either completely or not at all.
+#
+# Copying every structure per write would make /train O(size of the brain),
+# so each structure is a shared frozen base plus a small delta that is
+# copied on write and folded into a new base once it grows. The
+# near-duplicate index is append-only and shared outright instead.
+# Corrections fold into a CompactCorrections base rather than a dict.
+
+DELTA_LIMIT = 64
+
+
+class LayeredMap(Mapping):
+    """Read-only dict made of a shared base and a small per-version delta."""
+
+    def __init__(self, base: Dict, delta: Optional[Dict] = None):
+        self.base = base
+        self.delta = delta or {}
+        self.added = sum(1 for k in self.delta if k not in base)
+
+    def __getitem__(self, key):
+        if key in self.delta: return self.delta[key]
+        return self.base[key]
+
+    def get(self, key, default=None):
+        value = self.delta.get(key, self)
+        if value is self: value = self.base.get(key, default)
+        return value
+
+    def __contains__(self, key): return key in self.delta or key in self.base
+
+    def __len__(self): return len(self.base) + self.added
+
+    def __iter__(self) -> Iterator:
+        # Same order a plain dict updated in place would have
+        yield from self.base
+        yield from (k for k in self.delta if k not in self.base)
+
+    def to_dict(self) -> Dict:
+        merged = dict(self.base.items())
+        merged.update(self.delta)
+        return merged
+
+    def folded(self) -> Mapping:
+        """Base and delta as one plain base."""
+        if not self.delta: return self.base
+        if isinstance(self.base, CompactCorrections): return self.base.merged(self.delta)
+        return self.to_dict()
+
+    def with_items(self, items: Iterable[Tuple]) -> "LayeredMap":
+        delta = dict(self.delta)
+        delta.update(items)
+        if len(delta) > max(DELTA_LIMIT, isqrt(len(self.base))):
+            return LayeredMap(LayeredMap(self.base, delta).folded())
+        return LayeredMap(self.base, delta)
+
+
+class LayeredFuzzyIndex:
+    """FuzzyIndex over a shared base plus a small rebuilt-per-write delta."""
+
+    def __init__(self, base: FuzzyIndex, delta: Optional[FuzzyIndex] = None):
+        self.base = base
+        self.delta = delta or FuzzyIndex()
+
+    @property
+    def entries(self) -> List[str]: return self.base.entries + self.delta.entries
+
+    def __len__(self): return len(self.base) + len(self.delta)
+
+    def __contains__(self, entry): return entry in self.base or entry in self.delta
+
+    def folded(self) -> FuzzyIndex:
+        return FuzzyIndex(self.entries) if len(self.delta) else self.base
+
+    def best_match(self, word: str, cutoff: float = 0.6) -> Optional[str]:
+        best = self.base.best_scored(word, cutoff)
+        if len(self.delta):
+            other = self.delta.best_scored(word, cutoff)
+            if other and (best is None or other > best): best = other
+        return best[1] if best else None
+
+    def with_entries(self, entries: Iterable[str]) -> "LayeredFuzzyIndex":
+        new = [e for e in dict.fromkeys(entries) if e not in self]
+        if not new: return self
+        delta = self.delta.entries + new
+        if len(delta) > DELTA_LIMIT:
+            return LayeredFuzzyIndex(FuzzyIndex(self.base.entries + delta))
+        return LayeredFuzzyIndex(self.base, FuzzyIndex(delta))
+
+
+def correction_changes(raw_text: str, corrected_data: Dict):
+    """What one /train record teaches: (correction key, brand aliases, model)."""
+    aliases = []
+    brand = corrected_data.get("brand")
+    if brand and brand != "Unknown":
+        # A blank text has no first word to alias: only the brand's own name is learned
+        words = raw_text.split()
+        aliases = [(words[0].upper(), brand)] if words else []
+        aliases.append((brand.upper(), brand))
+    return raw_text.strip().lower(), aliases, corrected_data.get("model") or None
+
+
+class KnowledgeSnapshot:
+    __slots__ = ("version", "brands", "corrections", "brand_index", "model_index", "near_index")
+
+    def __init__(self, version: int, brands: LayeredMap, corrections: LayeredMap,
+                 brand_index: LayeredFuzzyIndex, model_index: LayeredFuzzyIndex,
+                 near_index: NearDuplicateIndex):
+        self.version = version
+        self.brands = brands
+        self.corrections = corrections
+        self.brand_index = brand_index
+        self.model_index = model_index
+        self.near_index = near_index  # may know keys newer than `corrections`
+
+    @classmethod
+    def from_dict(cls, data: Dict, version: int = 0) -> "KnowledgeSnapshot":
+        return cls(
+            version,
+            LayeredMap(dict(data["brands"])),
+            LayeredMap(CompactCorrections.from_items(data["corrections"].items())),
+            LayeredFuzzyIndex(FuzzyIndex(data["brands"].keys())),
+            LayeredFuzzyIndex(FuzzyIndex(data["models"])),
+            NearDuplicateIndex(data["corrections"].keys())
+        )
+
+    @property
+    def models(self) -> List[str]: return self.model_index.entries
+
+    def to_dict(self) -> Dict:
+        return {
+            "brands": self.brands.to_dict(),
+            "models": self.models,
+            "corrections": self.corrections.to_dict()
+        }
+
+    def learn(self, raw_text: str, corrected_data: Dict) -> "KnowledgeSnapshot":
+        """The next snapshot, with one correction applied."""
+        return self.learn_many([(raw_text, corrected_data)])
+
+    def learn_many(self, records: Iterable[Tuple[str, Dict]]) -> "KnowledgeSnapshot":
+        """The next snapshot, with (raw_text, corrected_data) records applied in order.
+
+        However many records there are, each structure is copied or folded once.
+        """
+        corrections, aliases, models = {}, [], []
+        for raw_text, corrected_data in records:
+            key, record_aliases, model = correction_changes(raw_text, corrected_data)
+            corrections[key] = corrected_data
+            aliases += record_aliases
+            if model: models.append(model)
+        self.near_index.add_many(corrections)
+        return KnowledgeSnapshot(
+            self.version + 1,
+            self.brands.with_items(aliases),
+            self.corrections.with_items(corrections.items()),
+            self.brand_index.with_entries(alias for alias, _ in aliases),
+            self.model_index.with_entries(models),
+            self.near_index
+        )
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+except ImportError:  # optional: without them the parser keeps to its rules
+    np = None
+
+# ==========================================
+# LEARNED BRAND/MODEL ENGINE
+# ==========================================
+# Character n-gram hashing features and two log-loss linear models: one
+# for the brand, one for the (brand, model) pair, so a confident model
+# always comes with the brand it was learned under. Whatever falls below
+# the confidence floor is left to the rule path.
+#
+# Fitting happens on a background thread from the latest knowledge
+# snapshot; /train only marks the engine dirty. Each fit is published as
+# one immutable LearnedModel, so a batch predicts against a single model.
+#
+# Every class is a dense row of N_FEATURES float64 weights, 512 KiB, in
+# each worker: 10k (brand, model) pairs would be ~5 GB. Only the max_pairs
+# most frequent pairs get a class; listings of the others keep to the
+# rules for their model, and still train the brand model.
+
+N_FEATURES = 2 ** 16
+MAX_PAIRS = 128
+
+
+class LearnedModel:
+    __slots__ = ("version", "examples", "brand_clf", "pair_clf", "pairs")
+
+    def __init__(self, version: int, examples: int, brand_clf, pair_clf, pairs: List[Tuple[str, str]]):
+        self.version = version
+        self.examples = examples
+        self.brand_clf = brand_clf
+        self.pair_clf = pair_clf
+        self.pairs = pairs
+
+
+class LearnedEngine:
+    def __init__(self, extra_file: Optional[str] = None, min_confidence: float = 0.6, debounce: float = 1.0,
+                 max_pairs: int = MAX_PAIRS):
+        self.extra_file = extra_file
+        self.min_confidence = min_confidence
+        self.max_pairs = max_pairs
+        self.debounce = debounce
+        self.vectorizer = HashingVectorizer(analyzer="char_wb", ngram_range=(2, 4), n_features=N_FEATURES,
+                                            alternate_sign=False) if np is not None else None
+        self.current: Optional[LearnedModel] = None
+        self.pending = None  # newest snapshot not yet trained on
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.fits = 0
+        self.last_fit_seconds = 0.0
+
+    @property
+    def available(self) -> bool: return np is not None
+
+    @property
+    def generation(self) -> int: return self.current.version if self.current else 0
+
+    # --- Training ---
+
+    def examples(self, kb) -> Dict[str, Dict]:
+        """Listing text -> corrected record; stored corrections win over the seed file."""
+        found = {}
+        if self.extra_file and os.path.exists(self.extra_file):
+            with open(self.extra_file) as f:
+                for record in json.load(f):
+                    if isinstance(record.get("data"), dict): found[record["input"]] = record["data"]
+        for key in kb.corrections:
+            data = kb.corrections[key]
+            found[data.get("raw_text") or key] = data
+        return {text: data for text, data in found.items()
+                if text.strip() and data.get("brand") and data["brand"] != "Unknown"}
+
+    def fit(self, kb) -> Optional[LearnedModel]:
+        found = self.examples(kb)
+        texts = [text.lower() for text in found]
+        brands = [data["brand"] for data in found.values()]
+        if len(set(brands)) < 2: return None  # nothing to tell apart yet
+
+        X = self.vectorizer.transform(texts)
+        brand_clf = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0).fit(X, brands)
+
+        pair_clf = None
+        labelled = [(i, (data["brand"], data["model"])) for i, data in enumerate(found.values()) if data.get("model")]
+        pairs = sorted(pair for pair, _ in Counter(pair for _, pair in labelled).most_common(self.max_pairs))
+        if len(pairs) >= 2:
+            index = {pair: n for n, pair in enumerate(pairs)}
+            labelled = [(i, pair) for i, pair in labelled if pair in index]
+            rows = [i for i, _ in labelled]
+            pair_clf = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0).fit(
+                X[rows], [index[pair] for _, pair in labelled])
+        return LearnedModel(0, len(texts), brand_clf, pair_clf, pairs)
+
+    def retrain(self, kb):
+        started = time.perf_counter()
+        model = self.fit(kb)
+        with self.lock:
+            if model is not None:
+                model.version = self.generation + 1
+                self.current = model
+            self.fits += 1
+            self.last_fit_seconds = time.perf_counter() - started
+
+    def schedule(self, kb):
+        """Retrain on `kb` soon, off the calling thread. Bursts coalesce."""
+        if not self.available: return
+        self.pending = kb
+        self.wakeup.set()
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="learned-engine", daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.debounce)
+            self.wakeup.clear()
+            kb, self.pending = self.pending, None
+            if kb is None: continue
+            try:
+                self.retrain(kb)
+            except Exception as e:
+                print(f"⚠️ Learned engine retrain failed: {e}")
+
+    # --- Prediction ---
+
+    def predict(self, texts: List[str], model: Optional[LearnedModel] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+        """(brand, model) per text, None where the engine is not confident."""
+        model = model or self.current
+        if model is None or not texts: return [(None, None)] * len(texts)
+        X = self.vectorizer.transform([t.lower() for t in texts])
+        rows = np.arange(len(texts))
+
+        proba = model.brand_clf.predict_proba(X)
+        best = proba.argmax(axis=1)
+        sure = proba[rows, best] >= self.min_confidence
+        brands = [str(model.brand_clf.classes_[b]) if ok else None for b, ok in zip(best, sure)]
+
+        names = [None] * len(texts)
+        if model.pair_clf is not None:
+            proba = model.pair_clf.predict_proba(X)
+            best = proba.argmax(axis=1)
+            sure = proba[rows, best] >= self.min_confidence
+            for i in np.flatnonzero(sure):
+                brands[i], names[i] = model.pairs[model.pair_clf.classes_[best[i]]]
+        return list(zip(brands, names))
+
+    def stats(self) -> Dict:
+        model = self.current
+        return {
+            "available": self.available,
+            "version": self.generation,
+            "examples": model.examples if model else 0,
+            "brands": len(model.brand_clf.classes_) if model else 0,
+            "pairs": len(model.pairs) if model else 0,
+            "max_pairs": self.max_pairs,
+            "fits": self.fits,
+            "last_fit_ms": self.last_fit_seconds * 1000,
+            "pending": self.pending is not None,
+            "min_confidence": self.min_confidence
+        }
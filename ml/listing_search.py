@@ -0,0 +1,511 @@
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from near_duplicates import words
+from training_journal import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: one worker per listing log there
+    fcntl = None
+
+# ==========================================
+# LISTING SEARCH INDEX
+# ==========================================
+# Inverted index over parsed listings, filled as /extract sees them.
+# Words of the listing text and the exact-match fields (brand, model,
+# ram_gb, storage_gb) each map to the posting list of their document ids.
+# Price and battery map coarse value buckets (~2% wide) to posting lists
+# as well, and are also kept in sorted (value, id) order for sorting.
+#
+# Most terms belong to a handful of listings, so a posting list is a
+# sorted uint32 array (4 bytes an id) until it is dense enough for a
+# bitmap: one Python int per block of 65536 ids (8 KB each), on which
+# intersecting and counting matches runs in C however common the words
+# are. Queries turn the short arrays into bitmaps as they go. Range
+# buckets are read by every range query and sort, and there are only a few
+# hundred per field, so they are always bitmaps. A range is the
+# union of the buckets it covers plus the exactly-checked ids of the two
+# buckets it cuts through. Ids grow with every insert, so "newest first"
+# is the highest ids; price order visits the buckets cheapest (or dearest)
+# first and sorts only the matches they hold.
+
+EXACT_FIELDS = ("brand", "model", "ram_gb", "storage_gb")
+RANGE_FIELDS = {"price": "price", "battery": "battery_percent"}
+INF, NAN = float("inf"), float("nan")
+SORTS = ("recent", "price_asc", "price_desc")
+
+BLOCK = 16
+BLOCK_MASK = (1 << BLOCK) - 1
+BLOCK_BYTES = (1 << BLOCK) // 8
+ONE_RE = re.compile("1")
+BUCKETS_PER_E = 50  # range buckets are [e^(k/50), e^((k+1)/50)): ~2% wide
+
+
+def value_bucket(value: float) -> int:
+    return int(math.log(value) * BUCKETS_PER_E) if value > 1 else 0
+
+
+def field_value(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+class Bitmap:
+    """Set of document ids, one int bitmap per block of 65536 ids."""
+    __slots__ = ("blocks",)
+
+    def __init__(self, blocks: Optional[Dict[int, int]] = None):
+        self.blocks = blocks if blocks is not None else {}
+
+    def __len__(self): return sum(bits.bit_count() for bits in self.blocks.values())
+
+    def __contains__(self, doc_id: int) -> bool:
+        return (self.blocks.get(doc_id >> BLOCK, 0) >> (doc_id & BLOCK_MASK)) & 1 == 1
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        small, large = sorted((self.blocks, other.blocks), key=len)
+        out = {}
+        for block, bits in small.items():
+            bits &= large.get(block, 0)
+            if bits: out[block] = bits
+        return Bitmap(out)
+
+    def __iter__(self) -> Iterator[int]:
+        """Ids, highest first: bin() puts the top bit first and the regex scans it in C."""
+        for block in sorted(self.blocks, reverse=True):
+            digits = bin(self.blocks[block])
+            top = (block << BLOCK) + len(digits) - 1
+            for m in ONE_RE.finditer(digits, 2):
+                yield top - m.start()
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        out = {}
+        for block, bits in self.blocks.items():
+            bits &= ~other.blocks.get(block, 0)
+            if bits: out[block] = bits
+        return Bitmap(out)
+
+    @classmethod
+    def union(cls, bitmaps: Iterable["Bitmap"]) -> "Bitmap":
+        out: Dict[int, int] = {}
+        for bitmap in bitmaps:
+            for block, bits in bitmap.blocks.items(): out[block] = out.get(block, 0) | bits
+        return cls(out)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "Bitmap":
+        views: Dict[int, bytearray] = {}
+        for doc_id in ids:
+            view = views.get(doc_id >> BLOCK)
+            if view is None: view = views[doc_id >> BLOCK] = bytearray(BLOCK_BYTES)
+            view[(doc_id & BLOCK_MASK) >> 3] |= 1 << (doc_id & 7)
+        return cls({block: int.from_bytes(view, "little") for block, view in views.items()})
+
+    def frozen(self) -> "FrozenBitmap": return FrozenBitmap(self.blocks)
+
+    def add(self, doc_id: int):
+        block = doc_id >> BLOCK
+        self.blocks[block] = self.blocks.get(block, 0) | (1 << (doc_id & BLOCK_MASK))
+
+    def discard(self, doc_id: int):
+        block = doc_id >> BLOCK
+        bits = self.blocks.get(block, 0) & ~(1 << (doc_id & BLOCK_MASK))
+        if bits: self.blocks[block] = bits
+        else: self.blocks.pop(block, None)
+
+
+# An array costs 4 bytes an id, a bitmap 8 KB a block it touches
+DENSE_IDS_PER_BLOCK = BLOCK_BYTES // 4
+
+
+class Postings:
+    """Ids holding one term: a sorted array while sparse, a Bitmap once dense.
+
+    Ids are added in increasing order (they grow with every insert).
+    """
+    __slots__ = ("ids", "bitmap")
+
+    def __init__(self):
+        self.ids: Optional[array] = array("I")
+        self.bitmap: Optional[Bitmap] = None
+
+    def __len__(self): return len(self.ids) if self.bitmap is None else len(self.bitmap)
+
+    def __bool__(self): return bool(self.ids) if self.bitmap is None else bool(self.bitmap.blocks)
+
+    def add(self, doc_id: int):
+        if self.bitmap is not None: return self.bitmap.add(doc_id)
+        ids = self.ids
+        ids.append(doc_id)
+        if len(ids) % 256 == 0 and len(ids) > DENSE_IDS_PER_BLOCK * ((ids[-1] >> BLOCK) - (ids[0] >> BLOCK) + 1):
+            self.bitmap, self.ids = Bitmap.from_ids(ids), None
+
+    def discard(self, doc_id: int):
+        if self.bitmap is not None: return self.bitmap.discard(doc_id)
+        i = bisect_left(self.ids, doc_id)
+        if i < len(self.ids) and self.ids[i] == doc_id: del self.ids[i]
+
+    def as_bitmap(self) -> Bitmap:
+        return self.bitmap if self.bitmap is not None else Bitmap.from_ids(self.ids)
+
+
+class FrozenBitmap(Bitmap):
+    """A query's result: each block also as bytes, so testing one id is O(1)."""
+    __slots__ = ("views",)
+
+    def __init__(self, blocks: Dict[int, int]):
+        super().__init__(blocks)
+        self.views = {block: bits.to_bytes(BLOCK_BYTES, "little") for block, bits in blocks.items()}
+
+    def __contains__(self, doc_id: int) -> bool:
+        view = self.views.get(doc_id >> BLOCK)
+        return view is not None and (view[(doc_id & BLOCK_MASK) >> 3] >> (doc_id & 7)) & 1 == 1
+
+
+class SortedPairs:
+    """(value, id) pairs in order, held in short chunks so inserts stay cheap."""
+    LOAD = 512
+
+    def __init__(self):
+        self.chunks: List[List[Tuple]] = []
+        self.maxes: List[Tuple] = []
+
+    def __len__(self): return sum(map(len, self.chunks))
+
+    def add(self, pair: Tuple):
+        if not self.chunks:
+            self.chunks.append([pair])
+            self.maxes.append(pair)
+            return
+        i = min(bisect_left(self.maxes, pair), len(self.chunks) - 1)
+        chunk = self.chunks[i]
+        insort(chunk, pair)
+        self.maxes[i] = chunk[-1]
+        if len(chunk) > 2 * self.LOAD:
+            self.chunks[i:i + 1] = [chunk[:self.LOAD], chunk[self.LOAD:]]
+            self.maxes[i:i + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+
+    def remove(self, pair: Tuple):
+        i = bisect_left(self.maxes, pair)
+        if i == len(self.chunks): return
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, pair)
+        if j == len(chunk) or chunk[j] != pair: return
+        del chunk[j]
+        if chunk: self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def _position(self, pair: Tuple, right: bool) -> Tuple[int, int]:
+        i = (bisect_right if right else bisect_left)(self.maxes, pair)
+        if i == len(self.chunks): return i, 0
+        return i, (bisect_right if right else bisect_left)(self.chunks[i], pair)
+
+    def span(self, low: Optional[float] = None, high: Optional[float] = None) -> "Span":
+        start = self._position((low,), False) if low is not None else (0, 0)
+        end = self._position((high, INF), True) if high is not None else (len(self.chunks), 0)
+        if start >= end: return Span(self.chunks, start, start, 0)
+        size = sum(map(len, self.chunks[start[0]:end[0]])) - start[1] + end[1]
+        return Span(self.chunks, start, end, size)
+
+
+class Span:
+    """The pairs of a SortedPairs lying in one value range, walkable both ways."""
+    __slots__ = ("chunks", "start", "end", "size")
+
+    def __init__(self, chunks: List[List[Tuple]], start: Tuple[int, int], end: Tuple[int, int], size: int):
+        self.chunks, self.start, self.end, self.size = chunks, start, end, size
+
+    def _slices(self) -> List[Tuple[int, int, int]]:
+        (si, sj), (ei, ej) = self.start, self.end
+        last = min(ei, len(self.chunks) - 1)
+        return [(ci, sj if ci == si else 0, ej if ci == ei else len(self.chunks[ci])) for ci in range(si, last + 1)]
+
+    def __iter__(self) -> Iterator[Tuple]:
+        for ci, lo, hi in self._slices(): yield from self.chunks[ci][lo:hi]
+
+    def __reversed__(self) -> Iterator[Tuple]:
+        for ci, lo, hi in reversed(self._slices()): yield from reversed(self.chunks[ci][lo:hi])
+
+
+Matches = Optional["FrozenBitmap"]  # None: every listing
+
+
+class ListingIndex:
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity  # 0 = unbounded; otherwise oldest listings go first
+        self.docs: Dict[int, Dict] = {}
+        self.ids: Dict[str, int] = {}  # listing key -> current doc id
+        self.keys: Dict[int, str] = {}
+        self.terms: Dict[str, Postings] = {}
+        self.fields: Dict[Tuple[str, Any], Postings] = {}
+        self.ranges: Dict[str, SortedPairs] = {name: SortedPairs() for name in RANGE_FIELDS}
+        self.values: Dict[str, Dict[int, float]] = {name: {} for name in RANGE_FIELDS}
+        self.buckets: Dict[str, Dict[int, Bitmap]] = {name: {} for name in RANGE_FIELDS}
+        self.bounds: Dict[str, Dict[int, List[float]]] = {name: {} for name in RANGE_FIELDS}  # may overreach
+        self.priced = Bitmap()
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def __len__(self): return len(self.docs)
+
+    # --- Writes ---
+
+    def postings(self, listing: Dict) -> Iterator[Tuple[Dict, Any]]:
+        for term in set(words(str(listing.get("raw_text") or ""))):
+            yield self.terms, term
+        for name in EXACT_FIELDS:
+            value = field_value(listing.get(name))
+            if value is not None and value != "": yield self.fields, (name, value)
+
+    def add(self, key: str, listing: Dict):
+        """Index a parsed listing under `key`, replacing what the key held."""
+        with self.lock:
+            old = self.ids.get(key)
+            if old is not None: self._remove(old)
+            doc_id = self.next_id
+            self.next_id += 1
+            self.docs[doc_id] = listing
+            self.ids[key] = doc_id
+            self.keys[doc_id] = key
+
+            for postings, posting in self.postings(listing):
+                ids = postings.get(posting)
+                if ids is None: ids = postings[posting] = Postings()
+                ids.add(doc_id)
+            for name, source in RANGE_FIELDS.items():
+                value = listing.get(source)
+                if isinstance(value, (int, float)) and math.isfinite(value):
+                    self.ranges[name].add((value, doc_id))
+                    self.values[name][doc_id] = value
+                    bucket = value_bucket(value)
+                    bounds = self.bounds[name].get(bucket)
+                    if bounds is None:
+                        self.buckets[name][bucket] = Bitmap()
+                        self.bounds[name][bucket] = [value, value]
+                    else: bounds[:] = min(bounds[0], value), max(bounds[1], value)
+                    self.buckets[name][bucket].add(doc_id)
+            if doc_id in self.values["price"]: self.priced.add(doc_id)
+
+            while self.capacity and len(self.docs) > self.capacity:
+                self._remove(next(iter(self.docs)))
+
+    def add_many(self, items: Iterable[Tuple[str, Dict]]):
+        for key, listing in items: self.add(key, listing)
+
+    def holds(self, key: str, listing: Dict) -> bool:
+        with self.lock:
+            doc_id = self.ids.get(key)
+            return doc_id is not None and self.docs[doc_id] == listing
+
+    def _remove(self, doc_id: int):
+        listing = self.docs.pop(doc_id)
+        del self.ids[self.keys.pop(doc_id)]
+        for postings, posting in self.postings(listing):
+            ids = postings.get(posting)
+            if ids is None: continue
+            ids.discard(doc_id)
+            if not ids: del postings[posting]
+        for name in RANGE_FIELDS:
+            value = self.values[name].pop(doc_id, None)
+            if value is None: continue
+            self.ranges[name].remove((value, doc_id))
+            bucket = value_bucket(value)
+            self.buckets[name][bucket].discard(doc_id)
+            if not self.buckets[name][bucket].blocks:
+                del self.buckets[name][bucket]
+                del self.bounds[name][bucket]
+        self.priced.discard(doc_id)
+
+    def bucket_range(self, low: float, high: float) -> Tuple[float, float]:
+        return value_bucket(low) if low > -INF else -1, value_bucket(high) if high < INF else INF
+
+    def in_range(self, name: str, low: float, high: float) -> Bitmap:
+        """Listings whose `name` lies in [low, high]."""
+        first, last = self.bucket_range(low, high)
+        inside, edges = [], []
+        for bucket, ids in self.buckets[name].items():
+            lo, hi = self.bounds[name][bucket]
+            if first < bucket < last or low <= lo and hi <= high: inside.append(ids)
+            # A bucket the range cuts through: its in-range ids straight from the sorted values.
+            # Values of neighbouring buckets lie strictly outside [lo, hi], stale or not.
+            elif bucket == first or bucket == last:
+                edges.extend(d for _, d in self.ranges[name].span(max(low, lo), min(high, hi)))
+        return Bitmap.union(inside + [Bitmap.from_ids(edges)])
+
+    # --- Queries ---
+
+    def search(self, text: str = "", filters: Optional[Dict[str, Any]] = None,
+               ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+               sort: str = "recent", offset: int = 0, limit: int = 20) -> Dict:
+        """Listings matching every word of `text`, every filter and every range."""
+        with self.lock:
+            found = [self.terms.get(term) for term in dict.fromkeys(words(text))]
+            for name, value in (filters or {}).items():
+                if value is not None: found.append(self.fields.get((name, field_value(value))))
+            spans = {name: (-INF if low is None else low, INF if high is None else high)
+                     for name, (low, high) in (ranges or {}).items() if low is not None or high is not None}
+            if any(p is None for p in found):
+                matches: Matches = FrozenBitmap({})
+            else:
+                postings = [p.as_bitmap() for p in found]
+                postings += [self.in_range(name, low, high) for name, (low, high) in spans.items()]
+                postings.sort(key=lambda p: len(p.blocks))
+                matches = postings[0] if postings else None
+                for other in postings[1:]: matches = matches & other
+                if matches is not None: matches = matches.frozen()
+            total = len(self.docs) if matches is None else len(matches)
+
+            want = offset + limit
+            if sort == "recent": ids = list(islice(self.in_order(matches), want))
+            else: ids = self.by_price(matches, want, sort == "price_desc", spans.get("price"))
+            return {
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "results": [dict(self.docs[d], listing_id=self.keys[d]) for d in ids[offset:want]]
+            }
+
+    def in_order(self, matches: Matches) -> Iterator[int]:
+        """Matching ids, newest first."""
+        return reversed(self.docs) if matches is None else iter(matches)
+
+    def by_price(self, matches: Matches, want: int, descending: bool,
+                 price: Optional[Tuple[float, float]]) -> List[int]:
+        """Priced listings in price order (ties newest first), then unpriced newest first."""
+        prices = self.values["price"]
+        ids = []
+        if matches is None:
+            # Everything matches: the sorted values are the answer
+            span = self.ranges["price"].span(*price) if price else self.ranges["price"].span()
+            run, run_price = [], None
+            for value, d in (reversed(span) if descending else iter(span)):
+                if value != run_price:
+                    ids.extend(sorted(run, reverse=True))
+                    if len(ids) >= want: return ids[:want]
+                    run, run_price = [], value
+                run.append(d)
+            ids.extend(sorted(run, reverse=True))
+        else:
+            # Buckets in price order, each cut down to the matches, until enough are found.
+            # Hits iterate newest first and sorted() is stable, so ties stay newest first.
+            first, last = self.bucket_range(*price) if price else (-1, INF)
+            buckets = self.buckets["price"]
+            for bucket in sorted(buckets, reverse=descending):
+                if not first <= bucket <= last: continue
+                hits = buckets[bucket] & matches
+                if not hits.blocks: continue
+                ids.extend(sorted(hits, key=prices.__getitem__, reverse=descending))
+                if len(ids) >= want: return ids[:want]
+        if price is None:
+            rest = (d for d in self.in_order(matches) if d not in prices) if matches is None \
+                else iter(matches - self.priced)
+            ids.extend(islice(rest, want - len(ids)))
+        return ids[:want]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "listings": len(self.docs),
+                "capacity": self.capacity,
+                "terms": len(self.terms),
+                "field_values": len(self.fields)
+            }
+
+
+# ==========================================
+# SHARED LISTING LOG
+# ==========================================
+# The index above is one process's memory. With a log, listings are not
+# indexed where they are extracted: every worker appends them to one JSONL
+# file (and bulk_parse.py --index appends an archive), and each worker
+# indexes the file by tailing it from its own offset. So every worker
+# searches the listings all of them saw, and a restart replays the file.
+#
+# Appends and compaction hold an exclusive lock on "<log>.lock". Once the
+# file holds twice the index capacity in lines, the worker that notices
+# rewrites it with just the listings its index keeps; the others see a new
+# inode and read it from the start, skipping listings they already hold.
+
+
+def log_line(key: str, listing: Dict) -> str:
+    return json.dumps({"key": key, "listing": listing}, separators=(",", ":")) + "\n"
+
+
+class ListingLog:
+    def __init__(self, path: str, index: ListingIndex):
+        self.path = path
+        self.index = index
+        self.inode = None
+        self.offset = 0  # bytes of the file indexed so far
+        self.lines = 0
+        self.sync_lock = threading.Lock()
+
+    def locked(self):
+        lock_file = open(self.path + ".lock", "a")
+        if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file closes
+        return lock_file
+
+    def append_many(self, items: Iterable[Tuple[str, Dict]]):
+        text = "".join(log_line(key, listing) for key, listing in items)
+        if not text: return
+        with self.locked(), open(self.path, "a") as f:
+            f.write(text)
+
+    def append(self, key: str, listing: Dict): self.append_many([(key, listing)])
+
+    def sync(self, wait: bool = False):
+        """Index what was appended since the last sync.
+
+        Searches call this without waiting: if another thread is already
+        catching up they search what is indexed so far.
+        """
+        if not self.sync_lock.acquire(blocking=wait): return
+        try:
+            self.read_new()
+            if self.index.capacity and self.lines > 2 * self.index.capacity:
+                with self.locked():
+                    self.compact()
+        finally:
+            self.sync_lock.release()
+
+    def read_new(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self.inode and stat.st_size == self.offset: return
+        with open(self.path, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            # Rewritten by a compaction: what this index already holds is skipped
+            rewritten = inode != self.inode and self.inode is not None
+            if inode != self.inode: self.inode, self.offset, self.lines = inode, 0, 0
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a line still being written is read next time
+        self.offset += end
+        for line in data[:end].splitlines():
+            self.lines += 1
+            try:
+                record = json.loads(line)
+                key, listing = record["key"], record["listing"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if rewritten and self.index.holds(key, listing): continue
+            self.index.add(key, listing)
+
+    def compact(self):
+        """Rewrite the log as the listings this index keeps. Hold the log lock."""
+        self.read_new()
+        with self.index.lock:
+            text = "".join(log_line(self.index.keys[d], listing) for d, listing in self.index.docs.items())
+        write_atomic(self.path, text)
+        stat = os.stat(self.path)
+        self.inode, self.offset, self.lines = stat.st_ino, stat.st_size, len(self.index.docs)
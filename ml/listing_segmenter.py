@@ -0,0 +1,110 @@
+import re
+from typing import Callable, Iterator, List, NamedTuple, Tuple
+
+# ==========================================
+# MULTI-LISTING SEGMENTATION
+# ==========================================
+# Dealer broadcasts paste dozens of phones into one message. They are cut
+# into listings with the parser's own cues, lazily, so the first listing
+# can be parsed while the rest of the paste is still being read:
+#
+#   brand    the first word is a known brand alias
+#   spec     a RAM/storage ratio (8/128) or a GB amount
+#   price    a standalone 4-7 digit number
+#
+# A listing is a run of lines holding at least a spec or a price. A line
+# opening with a brand starts the next listing once the current one has
+# a body; a brand word inside a line splits it when both halves have one.
+# A spec/price line after a priced listing is another variant of the same
+# phone ("iPhone 13" / "128gb 95000" / "256gb 105000") and inherits its
+# header. Text without any body (greetings, contact lines) is dropped,
+# and so are phone numbers.
+
+# WhatsApp emphasis, and bullets / emoji / "1." numbering at line start
+EMPHASIS_RE = re.compile(r"[*_~]+")
+LEAD_RE = re.compile(r"^(?:[^\w%/🔋]+|\d{1,2}[.)](?=\s))+")
+# Contact numbers (0300-1234567, +92 300 1234567) would otherwise read as prices
+PHONE_RE = re.compile(r"(?:\+\d{1,3}[\s-]?|\b0)\d{2,4}[\s-]?\d{6,8}\b")
+
+
+class Segment(NamedTuple):
+    text: str
+    line: int  # 1-based line of the paste the listing starts on
+
+
+class Cues(NamedTuple):
+    brand: bool
+    spec: bool
+    price: bool
+
+    @property
+    def body(self) -> bool: return self.spec or self.price
+
+
+class ListingSegmenter:
+    def __init__(self, tokenize: Callable[[str], Tuple[List[str], List]], is_brand: Callable[[str], bool]):
+        self.tokenize = tokenize
+        self.is_brand = is_brand
+
+    def cues(self, text: str) -> Cues:
+        words, tokens = self.tokenize(text)
+        return Cues(
+            bool(words) and self.is_brand(words[0]),
+            any(t.kind in ("ratio", "unit") for t in tokens),
+            any(t.kind == "number" and t.bounded and 4 <= len(t.digits) <= 7 for t in tokens))
+
+    def header(self, text: str) -> str:
+        """The words before the first spec or price: the phone a variant line belongs to."""
+        head = []
+        for word in text.split():
+            if self.cues(word).body: break
+            head.append(word)
+        return " ".join(head)
+
+    def pieces(self, line: str) -> Iterator[str]:
+        """A line, cut before every brand word that has a listing body on both sides."""
+        words = line.split()
+        start = 0
+        for i in range(1, len(words)):
+            if not self.is_brand(words[i]): continue
+            if self.cues(" ".join(words[start:i])).body and self.cues(" ".join(words[i:])).body:
+                yield " ".join(words[start:i])
+                start = i
+        yield " ".join(words[start:])
+
+    def split(self, blob: str) -> Iterator[Segment]:
+        parts: List[str] = []
+        head, start = "", 0
+        branded = has_body = priced = False
+
+        def flush():
+            nonlocal parts, branded, has_body, priced
+            if has_body: yield Segment(" ".join(parts), start)
+            parts, branded, has_body, priced = [], False, False, False
+
+        for number, line in enumerate(blob.splitlines(), 1):
+            line = LEAD_RE.sub("", PHONE_RE.sub(" ", EMPHASIS_RE.sub(" ", line))).strip()
+            if not any(ch.isalnum() for ch in line):
+                # Blank and divider lines close a listing
+                yield from flush()
+                head = ""
+                continue
+            for piece in self.pieces(line):
+                cues = self.cues(piece)
+                if parts and cues.brand and (has_body or not branded):
+                    # The next phone; a body-less group before it was only a header
+                    yield from flush()
+                    head = ""
+                elif parts and priced and cues.body and not cues.brand:
+                    # Another variant of the phone just listed
+                    yield from flush()
+                    if head: parts, branded = [head], self.cues(head).brand
+                    start = number
+                if not parts: start = number
+                if not has_body and not cues.body: head = " ".join(parts + [piece])
+                elif not has_body: head = " ".join(parts + [self.header(piece)]).strip()
+                parts.append(piece)
+                branded = branded or cues.brand
+                has_body = has_body or cues.body
+                priced = priced or cues.price
+        yield from flush()
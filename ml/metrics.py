@@ -0,0 +1,120 @@
+import threading
+from time import perf_counter
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ==========================================
+# LATENCY METRICS
+# ==========================================
+# Fixed-bucket histograms rendered in the Prometheus text format. Recording
+# is a bisect plus three additions under a per-histogram lock, cheap enough
+# to leave on under load. When disabled, every hook is a no-op.
+
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+FAMILIES = {
+    "extractor_stage_seconds": ("stage", "Time spent in each ListingParser stage"),
+    "extractor_request_seconds": ("endpoint", "Request handling time per endpoint"),
+    "extractor_persist_seconds": ("op", "Time spent persisting the knowledge base")
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+
+class Laps:
+    """Splits one pass through the parser into per-stage observations."""
+    __slots__ = ("series", "metrics", "family", "last")
+
+    def __init__(self, metrics: "Metrics", family: str):
+        self.series = metrics.series[family]
+        self.metrics = metrics
+        self.family = family
+        self.last = perf_counter()
+
+    def lap(self, stage: str):
+        now = perf_counter()
+        hist = self.series.get(stage) or self.metrics.histogram(self.family, stage)
+        hist.observe(now - self.last)
+        self.last = now
+
+
+class NoLaps:
+    __slots__ = ()
+    def lap(self, stage: str): pass
+
+NO_LAPS = NoLaps()
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # family -> label -> Histogram; only ever grows, so reads skip the lock
+        self.series: Dict[str, Dict[str, Histogram]] = {family: {} for family in FAMILIES}
+        self.lock = threading.Lock()
+
+    def histogram(self, family: str, label: str) -> Histogram:
+        hist = self.series[family].get(label)
+        if hist is None:
+            with self.lock:
+                hist = self.series[family].setdefault(label, Histogram())
+        return hist
+
+    def observe(self, family: str, label: str, seconds: float):
+        if self.enabled: self.histogram(family, label).observe(seconds)
+
+    def stages(self, family: str = "extractor_stage_seconds"):
+        return Laps(self, family) if self.enabled else NO_LAPS
+
+    @contextmanager
+    def timed(self, family: str, label: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(family, label, perf_counter() - start)
+
+    def render(self, gauges: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+        """Prometheus text exposition. gauges: (name, help, labels, value)."""
+        lines = []
+        for family, (label_name, help_text) in FAMILIES.items():
+            series = sorted(dict(self.series[family]).items())
+            if not series: continue
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} histogram")
+            for label, hist in series:
+                with hist.lock:
+                    counts, total = list(hist.counts), hist.sum
+                running = 0
+                for bound, n in zip(BUCKETS, counts):
+                    running += n
+                    lines.append(f'{family}_bucket{{{label_name}="{label}",le="{bound}"}} {running}')
+                running += counts[-1]
+                lines.append(f'{family}_bucket{{{label_name}="{label}",le="+Inf"}} {running}')
+                lines.append(f'{family}_sum{{{label_name}="{label}"}} {total}')
+                lines.append(f'{family}_count{{{label_name}="{label}"}} {running}')
+
+        described = set()
+        for name, help_text, labels, value in gauges or []:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            tags = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{tags}}} {value}" if tags else f"{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# ==========================================
+# ASYNC MICRO-BATCHING
+# ==========================================
+# Concurrent single-item requests wait at most `max_wait` seconds (or until
+# `max_batch` items are queued) and are then handed to `handler` as one
+# list, in a worker thread. Each caller awaits its own future. The handler
+# returns one {"result": ...} or {"error": ...} entry per item, in order,
+# which is the shape ListingParser.parse_batch already produces.
+
+
+class MicroBatcher:
+    def __init__(self, handler: Callable[[List[Any]], List[Dict]], max_batch: int = 64, max_wait: float = 0.002):
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.pending: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.in_flight = 0
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future, time.perf_counter()))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending: return
+        batch, self.pending = self.pending, []
+
+        started = time.perf_counter()
+        for _, _, queued in batch:
+            waited = started - queued
+            self.wait_total += waited
+            if waited > self.wait_max: self.wait_max = waited
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        asyncio.get_running_loop().create_task(self.run(batch))
+
+    async def run(self, batch: List[tuple]):
+        self.in_flight += 1
+        try:
+            outcomes = await asyncio.get_running_loop().run_in_executor(
+                None, self.handler, [item for item, _, _ in batch])
+        except Exception as e:
+            outcomes = [{"error": e}] * len(batch)
+        finally:
+            self.in_flight -= 1
+
+        for (_, future, _), outcome in zip(batch, outcomes):
+            if future.done(): continue  # caller went away
+            if "error" in outcome:
+                error = outcome["error"]
+                future.set_exception(error if isinstance(error, Exception) else RuntimeError(error))
+            else:
+                future.set_result(outcome["result"])
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": len(self.pending),
+            "in_flight_batches": self.in_flight,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_wait_ms": self.wait_total / self.items * 1000 if self.items else 0.0,
+            "max_wait_ms_seen": self.wait_max * 1000
+        }
@@ -0,0 +1,202 @@
+import re
+import threading
+import numpy as np
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Sequence, Set, Tuple
+from zlib import crc32
+
+# ==========================================
+# NEAR-DUPLICATE INDEX (MinHash / LSH)
+# ==========================================
+# Listings are reduced to word and word-bigram shingles (case, spacing,
+# punctuation and emoji ignored) and summarised by a MinHash signature.
+# Bare numbers all become one token, so a repost that only changes its
+# price keeps every shingle; a short listing would otherwise lose a third
+# of them. Numbers that name a model are checked by the caller instead.
+# Signatures are cut into bands; listings sharing any band land in the
+# same bucket, so a lookup only scores the few stored texts it collides
+# with. Candidates are then ranked by their exact Jaccard similarity.
+#
+# The 32 hash functions are multiply-shift hashes of each shingle's CRC32,
+# evaluated for many shingles at once in numpy. CRC32 is the same in every
+# process, so band keys can be computed once and stored with a knowledge
+# snapshot: a loaded index is a sorted array searched in place. Keys added
+# in bulk become another such sorted run; only keys taught one at a time
+# since are kept in Python buckets.
+#
+# The index only ever grows and keys are never removed, so one instance
+# is shared by a snapshot and its successors. A reader on an older
+# snapshot may meet a key its corrections don't have yet; it skips it.
+
+WORD_RE = re.compile(r"[^\W_]+")
+NUMBER = "#"  # shingle standing in for any all-digit word
+BANDS, ROWS = 8, 4  # 32 hashes; ~95% recall at similarity 0.75, ~40% at 0.5
+
+_rng = np.random.default_rng(0x5EED)
+MULTIPLIERS = _rng.integers(1, 2 ** 63, BANDS * ROWS, dtype=np.uint64) | np.uint64(1)
+OFFSETS = _rng.integers(0, 2 ** 63, BANDS * ROWS, dtype=np.uint64)
+SHIFT = np.uint64(32)
+MIX = np.uint64(0x9E3779B97F4A7C15)
+# Band keys carry their band number in the top 3 bits, so all bands share one array
+BAND_BITS = np.uint64(61)
+BAND_TAGS = np.arange(BANDS, dtype=np.uint64) << BAND_BITS
+KEY_MASK = np.uint64((1 << 61) - 1)
+CHUNK = 2048  # texts hashed per numpy pass when building in bulk
+RUN_MIN = 1024  # keys added at once from which they are kept as a sorted run
+
+
+def words(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+def shingles(text: str) -> FrozenSet[str]:
+    tokens = [NUMBER if token.isdigit() else token for token in words(text)]
+    return frozenset(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b: return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+def band_keys(gram_sets: Sequence[FrozenSet[str]]) -> np.ndarray:
+    """(len, BANDS) band keys for non-empty shingle sets."""
+    # Each distinct shingle is hashed once; texts then gather their rows
+    vocab: Dict[str, int] = {}
+    sizes = np.fromiter(map(len, gram_sets), dtype=np.int64, count=len(gram_sets))
+    ids = np.fromiter((vocab.setdefault(g, len(vocab)) for grams in gram_sets for g in grams), dtype=np.int64,
+                      count=int(sizes.sum()))
+    crcs = np.fromiter((crc32(g.encode()) for g in vocab), dtype=np.uint64, count=len(vocab))
+    hashed = (crcs[:, None] * MULTIPLIERS + OFFSETS) >> SHIFT
+    ends = np.cumsum(sizes)
+
+    out = np.empty((len(gram_sets), BANDS), dtype=np.uint64)
+    for start in range(0, len(gram_sets), CHUNK):
+        stop = min(start + CHUNK, len(gram_sets))
+        first = ends[start - 1] if start else 0
+        starts = np.concatenate(([0], ends[start:stop - 1] - first))
+        signature = np.minimum.reduceat(hashed[ids[first:ends[stop - 1]]], starts, axis=0)
+        rows = signature.reshape(stop - start, BANDS, ROWS)
+        key = rows[:, :, 0]
+        for r in range(1, ROWS): key = key * MIX + rows[:, :, r]
+        out[start:stop] = (key & KEY_MASK) | BAND_TAGS
+    return out
+
+
+class Run(NamedTuple):
+    """Sorted band keys, the id of the text each came from, and id -> text."""
+    keys: np.ndarray
+    ids: np.ndarray
+    text: Callable[[int], str]
+    size: int
+
+
+class NearDuplicateIndex:
+    def __init__(self, texts: Iterable[str] = ()):
+        # Keys taught one at a time land in buckets; batches become sorted runs
+        self.buckets: Dict[int, List[str]] = {}
+        self.known: Set[str] = set()
+        self.runs: List[Run] = []
+        self.lock = threading.Lock()
+        # Hashed on first lookup, not at load: start-up stays O(read)
+        self.pending = list(texts)
+
+    @classmethod
+    def from_arrays(cls, keys: np.ndarray, ids: np.ndarray, text: Callable[[int], str]) -> "NearDuplicateIndex":
+        """An index over precomputed band keys (see to_arrays)."""
+        index = cls()
+        index.runs = [Run(keys, ids, text, len(ids) // BANDS)]
+        index.pending = None
+        return index
+
+    @staticmethod
+    def to_arrays(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted band keys of `texts` and, for each, the position of its text."""
+        grams = [shingles(text) for text in texts]
+        ids = np.fromiter((i for i, g in enumerate(grams) if g), dtype=np.uint32)
+        keys = band_keys([grams[i] for i in ids])
+        keys, ids = keys.ravel(), np.repeat(ids, BANDS)
+        order = np.argsort(keys, kind="stable")
+        return keys[order], ids[order]
+
+    def export(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """to_arrays(texts), reusing the band keys this index already holds for them."""
+        position = {text: i for i, text in enumerate(texts)}
+        keys, ids = [], []
+        for run in self.runs:
+            count = int(run.ids.max()) + 1 if len(run.ids) else 0
+            remap = np.fromiter((position.get(run.text(i), -1) for i in range(count)), np.int64, count)
+            mapped = remap[run.ids]
+            keys.append(run.keys[mapped >= 0])
+            ids.append(mapped[mapped >= 0])
+        with self.lock:
+            buckets = list(self.buckets.items())
+        pairs = [(band, i) for band, members in buckets for i in map(position.get, members) if i is not None]
+        if pairs:
+            keys.append(np.fromiter((band for band, _ in pairs), np.uint64, len(pairs)))
+            ids.append(np.fromiter((i for _, i in pairs), np.int64, len(pairs)))
+
+        seen = np.zeros(len(texts), dtype=bool)
+        for part in ids: seen[part] = True
+        missing = np.flatnonzero(~seen)
+        if len(missing):
+            missing_keys, missing_ids = self.to_arrays([texts[i] for i in missing])
+            keys.append(missing_keys)
+            ids.append(missing[missing_ids])
+        if not keys: return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint32)
+
+        keys, ids = np.concatenate(keys), np.concatenate(ids).astype(np.uint32)
+        order = np.lexsort((ids, keys))
+        keys, ids = keys[order], ids[order]
+        # A retaught text can be in more than one run or bucket
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (ids[1:] != ids[:-1])
+        return keys[keep], ids[keep]
+
+    def __len__(self):
+        return len(self.known) + len(self.pending or ()) + sum(run.size for run in self.runs)
+
+    def build(self):
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if not pending: return
+        self.add_many(pending)
+
+    def add(self, key: str):
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable[str]):
+        if self.pending is not None:
+            with self.lock:
+                if self.pending is not None: return self.pending.extend(keys)
+        keys = [key for key in dict.fromkeys(keys) if key not in self.known]
+        if len(keys) >= RUN_MIN:
+            band, ids = self.to_arrays(keys)
+            with self.lock:
+                self.runs = self.runs + [Run(band, ids, keys.__getitem__, len(ids) // BANDS)]
+            return
+        grams = [shingles(key) for key in keys]
+        keys = [key for key, g in zip(keys, grams) if g]
+        if not keys: return
+        rows = band_keys([g for g in grams if g]).tolist()
+        with self.lock:
+            for key, row in zip(keys, rows):
+                if key in self.known: continue
+                self.known.add(key)
+                for band in row: self.buckets.setdefault(band, []).append(key)
+
+    def candidates(self, grams: FrozenSet[str]) -> Set[str]:
+        bands = band_keys([grams])[0]
+        found = set()
+        for band in bands.tolist(): found.update(self.buckets.get(band, ()))
+        for run in self.runs:
+            lo = np.searchsorted(run.keys, bands, "left")
+            hi = np.searchsorted(run.keys, bands, "right")
+            for a, b in zip(lo.tolist(), hi.tolist()):
+                found.update(map(run.text, run.ids[a:b].tolist()))
+        return found
+
+    def similar(self, text: str, threshold: float) -> List[Tuple[float, str]]:
+        """Stored keys at least `threshold` similar to `text`, best first."""
+        if self.pending is not None: self.build()
+        grams = shingles(text)
+        if not grams or not (self.known or self.runs): return []
+        scored = [(jaccard(grams, shingles(key)), key) for key in self.candidates(grams)]
+        return sorted((s for s in scored if s[0] >= threshold), reverse=True)
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+# ==========================================
+# PARSE RESULT CACHE
+# ==========================================
+# Bounded LRU in front of ListingParser.parse. Every entry remembers the
+# knowledge-base generation it was parsed under; once /train bumps the
+# generation those entries are dropped on sight instead of being served.
+
+
+class ParseCache:
+    def __init__(self, capacity: int = 10000):
+        self.capacity = max(0, capacity)
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def __len__(self): return len(self.entries)
+
+    def get(self, key: Hashable, generation: int) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generation:
+                del self.entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Dict, generation: int):
+        if not self.capacity: return
+        with self.lock:
+            self.entries[key] = (generation, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock: self.entries.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,270 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from training_journal import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: one worker per sketch file there
+    fcntl = None
+
+# ==========================================
+# PRICE SKETCHES (t-digest)
+# ==========================================
+# One merging t-digest of asking prices per (brand, model, storage), plus
+# one per (brand, model) across storage sizes for thin keys. A digest
+# holds at most ~compression centroids however many prices it has seen,
+# and there are at most max_keys digests (least recently fed dropped), so
+# memory stays bounded.
+#
+# Digests merge by pooling centroids, which is what makes them shareable:
+# each worker keeps what it saw since its last flush and folds that into
+# the shared file under an exclusive lock, then starts afresh. Reads see
+# the shared file (reloaded when it changes) plus the unflushed part.
+
+COMPRESSION = 100
+BUFFER = 256
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+Key = Tuple[str, str, Optional[int]]
+
+
+class TDigest:
+    __slots__ = ("compression", "centroids", "buffer", "count", "min", "max")
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []  # (mean, weight), sorted by mean
+        self.buffer: List[Tuple[float, float]] = []
+        self.count = 0.0
+        self.min, self.max = math.inf, -math.inf
+
+    def add(self, value: float, weight: float = 1.0):
+        self.buffer.append((value, weight))
+        self.count += weight
+        if value < self.min: self.min = value
+        if value > self.max: self.max = value
+        if len(self.buffer) >= BUFFER: self.compress()
+
+    def merge(self, other: "TDigest"):
+        if not other.count: return
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.compress()
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        return (math.sin(min(k, self.compression / 4) * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        """Fold the buffer in. Centroids near the tails stay small (the k1 scale)."""
+        if not self.buffer: return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        out = []
+        done = 0.0
+        limit = self._q(self._k(0.0) + 1) * self.count
+        mean, weight = points[0]
+        for value, w in points[1:]:
+            if done + weight + w <= limit:
+                weight += w
+                mean += (value - mean) * w / weight
+            else:
+                out.append((mean, weight))
+                done += weight
+                limit = self._q(self._k(done / self.count) + 1) * self.count
+                mean, weight = value, w
+        out.append((mean, weight))
+        self.centroids = out
+
+    def _points(self) -> List[Tuple[float, float]]:
+        # (cumulative weight, value): min at 0, each centroid at its middle, max at the end
+        self.compress()
+        points, done = [(0.0, self.min)], 0.0
+        for mean, weight in self.centroids:
+            points.append((done + weight / 2, mean))
+            done += weight
+        points.append((self.count, self.max))
+        return points
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count: return None
+        target = min(max(q, 0.0), 1.0) * self.count
+        points = self._points()
+        for (c0, v0), (c1, v1) in zip(points, points[1:]):
+            if target <= c1:
+                return v0 if c1 == c0 else v0 + (v1 - v0) * (target - c0) / (c1 - c0)
+        return self.max
+
+    def rank(self, value: float) -> Optional[float]:
+        """Fraction of prices at or below `value`."""
+        if not self.count: return None
+        if value < self.min: return 0.0
+        if value >= self.max: return 1.0
+        points = self._points()
+        for (c0, v0), (c1, v1) in zip(points, points[1:]):
+            if value < v1:
+                return (c0 if v1 == v0 else c0 + (c1 - c0) * (value - v0) / (v1 - v0)) / self.count
+        return 1.0
+
+    def to_dict(self) -> Dict:
+        self.compress()
+        return {"count": self.count, "min": self.min, "max": self.max, "centroids": self.centroids}
+
+    @classmethod
+    def from_dict(cls, data: Dict, compression: float = COMPRESSION) -> "TDigest":
+        digest = cls(compression)
+        digest.centroids = [tuple(c) for c in data["centroids"]]
+        digest.count = data["count"]
+        digest.min, digest.max = data["min"], data["max"]
+        return digest
+
+
+def listing_keys(listing: Dict) -> List[Key]:
+    """Sketch keys a parsed listing feeds, or [] if it carries no usable price."""
+    price, brand, model = listing.get("price"), listing.get("brand"), listing.get("model")
+    if not isinstance(price, (int, float)) or not price > 0 or not math.isfinite(price): return []
+    if not brand or brand == "Unknown" or not model: return []
+    brand, model = brand.lower(), model.lower()
+    storage = listing.get("storage_gb")
+    keys = [(brand, model, None)]
+    if isinstance(storage, int): keys.append((brand, model, storage))
+    return keys
+
+
+class PriceSketches:
+    def __init__(self, path: Optional[str] = None, max_keys: int = 20000, flush_every: float = 30.0,
+                 compression: float = COMPRESSION):
+        self.path = path
+        self.max_keys = max_keys
+        self.flush_every = flush_every
+        self.compression = compression
+        self.local: "OrderedDict[Key, TDigest]" = OrderedDict()  # not yet flushed, least recent first
+        self.shared: Dict[Key, TDigest] = {}
+        self.shared_stamp = None
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def __len__(self): return len(set(self.local) | set(self.shared))
+
+    # --- Feeding ---
+
+    def add(self, listing: Dict):
+        keys = listing_keys(listing)
+        if not keys: return
+        with self.lock:
+            for key in keys:
+                digest = self.local.get(key)
+                if digest is None:
+                    digest = self.local[key] = TDigest(self.compression)
+                    if len(self.local) > self.max_keys: self.local.popitem(last=False)
+                else: self.local.move_to_end(key)
+                digest.add(float(listing["price"]))
+
+    def flush_due(self) -> bool:
+        return (self.path is not None and self.local and not self.flush_lock.locked()
+                and time.monotonic() - self.last_flush >= self.flush_every)
+
+    # --- Persistence ---
+
+    def read_file(self) -> Dict[Key, TDigest]:
+        if not self.path or not os.path.exists(self.path): return {}
+        with open(self.path) as f:
+            data = json.load(f)
+        return {(s["brand"], s["model"], s["storage_gb"]): TDigest.from_dict(s, self.compression)
+                for s in data["sketches"]}
+
+    def flush(self):
+        """Merge what this worker saw since the last flush into the shared file."""
+        if self.path is None: return
+        with self.flush_lock:
+            with self.lock:
+                local, self.local = self.local, OrderedDict()
+                self.last_flush = time.monotonic()
+            if not local: return
+            try:
+                merged = self.merge_into_file(local)
+            except Exception:
+                with self.lock:  # keep the prices for the next attempt
+                    for key, digest in local.items():
+                        if key in self.local: digest.merge(self.local[key])
+                        self.local[key] = digest
+                raise
+            with self.lock:
+                self.shared, self.shared_stamp = merged, self.stamp()
+
+    def merge_into_file(self, local: Dict[Key, TDigest]) -> Dict[Key, TDigest]:
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file closes
+            merged = self.read_file()
+            for key, digest in local.items():
+                if key in merged: merged[key].merge(digest)
+                else: merged[key] = digest
+            if len(merged) > self.max_keys:
+                # The shared file keeps the best-sampled keys
+                keep = sorted(merged, key=lambda k: merged[k].count, reverse=True)[:self.max_keys]
+                merged = {key: merged[key] for key in keep}
+            write_atomic(self.path, json.dumps({"compression": self.compression, "sketches": [
+                {"brand": key[0], "model": key[1], "storage_gb": key[2], **digest.to_dict()}
+                for key, digest in merged.items()]}, separators=(",", ":")))
+        return merged
+
+    def stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except (OSError, TypeError):
+            return None
+
+    def refresh(self):
+        # Pick up flushes by other workers
+        stamp = self.stamp()
+        if stamp == self.shared_stamp: return
+        shared = self.read_file()
+        with self.lock:
+            self.shared, self.shared_stamp = shared, stamp
+
+    # --- Queries ---
+
+    def digest(self, key: Key) -> Optional[TDigest]:
+        self.refresh()
+        with self.lock:
+            shared, local = self.shared.get(key), self.local.get(key)
+            if local is None: return shared
+            merged = TDigest(self.compression)
+            for part in (shared, local):
+                if part is not None: merged.merge(part)
+            return merged
+
+    def stats(self, brand: str, model: str, storage_gb: Optional[int] = None, price: Optional[float] = None,
+              min_samples: int = 20, fence: float = 1.5) -> Dict:
+        """Price percentiles for a phone, and where `price` falls among them.
+
+        Falls back from (brand, model, storage) to (brand, model) while the
+        storage-specific sketch has fewer than `min_samples` prices. A price
+        is an outlier outside the Tukey fences: `fence` IQRs beyond Q1/Q3.
+        """
+        key = (brand.lower(), model.lower(), storage_gb)
+        digest = self.digest(key) if storage_gb is not None else None
+        if digest is None or digest.count < min_samples:
+            key = (key[0], key[1], None)
+            digest = self.digest(key)
+        out = {"brand": brand, "model": model, "storage_gb": key[2], "count": int(digest.count) if digest else 0,
+               "percentiles": {}, "price": price, "percentile_rank": None, "outlier": None}
+        if digest is None or not digest.count: return out
+        out["percentiles"] = {f"p{round(q * 100)}": digest.quantile(q) for q in QUANTILES}
+        if price is not None:
+            out["percentile_rank"] = digest.rank(price)
+            if digest.count >= min_samples:
+                q1, q3 = digest.quantile(0.25), digest.quantile(0.75)
+                out["outlier"] = not q1 - fence * (q3 - q1) <= price <= q3 + fence * (q3 - q1)
+        return out
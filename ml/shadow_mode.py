@@ -0,0 +1,198 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from training_journal import write_atomic
+
+# ==========================================
+# SHADOW PARSER
+# ==========================================
+# A candidate parser runs beside the live one on a sample of /extract
+# traffic, off the request path: the endpoint only drops the text into a
+# bounded queue (or drops the sample when the queue is full) and a daemon
+# thread re-parses it with both parsers against the same pinned snapshot.
+# Both are timed there, under the same conditions, and every field where
+# they disagree is counted, with the latest examples kept for review.
+#
+# Replay runs both over every stored correction and scores each against
+# the taught answer, field by field, so a candidate can be shown to be no
+# less accurate as well as faster. A summary is written to a JSON file.
+
+Parse = Callable[[str, Any], Dict]
+
+EXAMPLES = 50
+TIMINGS = 2000  # recent samples kept for percentiles
+
+
+def differing(a: Dict, b: Dict) -> List[str]:
+    return [field for field in dict.fromkeys(list(a) + list(b)) if field != "raw_text" and a.get(field) != b.get(field)]
+
+
+def timed(parse: Parse, text: str, kb) -> Tuple[Optional[Dict], float, Optional[str]]:
+    start = time.perf_counter()
+    try:
+        return parse(text, kb), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=TIMINGS)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def summary(self) -> Dict:
+        ordered = sorted(self.recent)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+        return {"count": self.count, "mean_ms": self.total / self.count * 1000 if self.count else None,
+                "p50_ms": pick(0.5), "p95_ms": pick(0.95)}
+
+
+class Scoreboard:
+    """Agreement of the two parsers on some set of listings."""
+
+    def __init__(self):
+        self.samples = 0
+        self.disagreements = 0
+        self.fields: Dict[str, int] = {}
+        self.errors = {"primary": 0, "candidate": 0}
+        self.timing = {"primary": Timing(), "candidate": Timing()}
+        self.examples = deque(maxlen=EXAMPLES)
+        # Against stored corrections: per field, how often each parser got it right
+        self.graded = 0
+        self.correct: Dict[str, Dict[str, int]] = {}
+
+    def add(self, text: str, primary, candidate, truth: Optional[Dict]):
+        (a, a_time, a_error), (b, b_time, b_error) = primary, candidate
+        self.samples += 1
+        self.timing["primary"].add(a_time)
+        self.timing["candidate"].add(b_time)
+        if a_error: self.errors["primary"] += 1
+        if b_error: self.errors["candidate"] += 1
+        fields = differing(a or {}, b or {}) if not (a_error or b_error) else ["error"]
+        if fields or a_error or b_error:
+            self.disagreements += 1
+            for field in fields: self.fields[field] = self.fields.get(field, 0) + 1
+            self.examples.append({"raw_text": text, "fields": fields, "primary": a or a_error, "candidate": b or b_error})
+        if truth is None: return
+        self.graded += 1
+        for field, value in truth.items():
+            if field == "raw_text": continue
+            score = self.correct.setdefault(field, {"primary": 0, "candidate": 0})
+            if a is not None and a.get(field) == value: score["primary"] += 1
+            if b is not None and b.get(field) == value: score["candidate"] += 1
+
+    def summary(self) -> Dict:
+        primary, candidate = self.timing["primary"], self.timing["candidate"]
+        return {
+            "samples": self.samples,
+            "disagreements": self.disagreements,
+            "field_disagreements": dict(sorted(self.fields.items(), key=lambda kv: -kv[1])),
+            "errors": dict(self.errors),
+            "timing": {"primary": primary.summary(), "candidate": candidate.summary(),
+                       # >1: the candidate is faster
+                       "speedup": primary.total / candidate.total if candidate.total else None},
+            "graded": self.graded,
+            "accuracy": {field: {who: n / self.graded for who, n in score.items()}
+                         for field, score in self.correct.items()} if self.graded else {},
+            "examples": list(self.examples)
+        }
+
+
+class ShadowRunner:
+    def __init__(self, primary: Parse, candidate: Parse, name: str, sample_rate: float = 0.05,
+                 max_queue: int = 1000, report_path: Optional[str] = None, report_every: float = 60.0):
+        self.primary = primary
+        self.candidate = candidate
+        self.name = name
+        self.sample_rate = sample_rate
+        self.report_path = report_path
+        self.report_every = report_every
+        self.queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(max_queue)
+        self.live = Scoreboard()
+        self.replayed: Optional[Scoreboard] = None
+        self.replay_running = False
+        self.offered = 0
+        self.dropped = 0
+        self.last_report = time.monotonic()
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # --- Live sampling ---
+
+    def offer(self, text: str, kb):
+        """Called on the request path: O(1), never blocks."""
+        if not isinstance(text, str) or random.random() >= self.sample_rate: return
+        self.offered += 1
+        try:
+            self.queue.put_nowait((text, kb))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            text, kb = self.queue.get()
+            truth = kb.corrections.get(text.strip().lower())
+            outcome = self.compare(text, kb)
+            with self.lock:
+                self.live.add(text, *outcome, truth)
+            if self.report_path and time.monotonic() - self.last_report >= self.report_every: self.write_report()
+
+    def compare(self, text: str, kb):
+        # Alternate who goes first so neither always runs on warm caches
+        if random.random() < 0.5:
+            return timed(self.primary, text, kb), timed(self.candidate, text, kb)
+        candidate = timed(self.candidate, text, kb)
+        return timed(self.primary, text, kb), candidate
+
+    # --- Replay against stored corrections ---
+
+    def replay(self, kb, corrections: Iterable[Tuple[str, Dict]]):
+        board = Scoreboard()
+        with self.lock:
+            self.replayed, self.replay_running = board, True
+        try:
+            for key, truth in corrections:
+                text = truth.get("raw_text") or key
+                outcome = self.compare(text, kb)
+                with self.lock:
+                    board.add(text, *outcome, truth)
+        finally:
+            with self.lock:
+                self.replay_running = False
+            if self.report_path: self.write_report()
+
+    def start_replay(self, kb) -> bool:
+        with self.lock:
+            if self.replay_running: return False
+            self.replay_running = True
+        threading.Thread(target=self.replay, args=(kb, kb.corrections.items()), daemon=True).start()
+        return True
+
+    # --- Reporting ---
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "enabled": True,
+                "candidate": self.name,
+                "sample_rate": self.sample_rate,
+                "offered": self.offered,
+                "dropped": self.dropped,
+                "queued": self.queue.qsize(),
+                "live": self.live.summary(),
+                "replay": dict(self.replayed.summary(), running=self.replay_running) if self.replayed else None
+            }
+
+    def write_report(self):
+        self.last_report = time.monotonic()
+        write_atomic(self.report_path, json.dumps(self.stats(), indent=2, default=str))
@@ -0,0 +1,96 @@
+import json
+import mmap
+import os
+import struct
+from typing import List, Optional
+import numpy as np
+from compact_corrections import CompactCorrections
+from fuzzy_index import FuzzyIndex
+from knowledge_snapshot import KnowledgeSnapshot, LayeredFuzzyIndex, LayeredMap
+from near_duplicates import NearDuplicateIndex
+from training_journal import atomic_file
+
+# ==========================================
+# BINARY KNOWLEDGE SNAPSHOT
+# ==========================================
+# A compact twin of training_data.json that loads without parsing it:
+#
+#   magic | header length | JSON header | 8-byte aligned sections
+#
+# The header records the size and mtime of the JSON it was built from, so
+# a snapshot older than its JSON is ignored and rebuilt. Corrections are
+# stored as the arrays of a CompactCorrections; the file is memory-mapped
+# and a correction is only decoded when it is looked up.
+# Brand aliases, models and the corrections' value pool are stored as JSON
+# and the fuzzy indexes rebuilt on load, so loading never executes anything;
+# the near-duplicate index is stored as its sorted band-key arrays, searched
+# in place. A file in an older encoding has another magic and is rebuilt.
+
+MAGIC = b"KBSNAP05"
+ALIGN = 8
+
+
+def source_stamp(path: str) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write(path: str, kb: KnowledgeSnapshot, stamp: List[int]):
+    """Write `kb` as a binary snapshot of the JSON file whose stamp is given.
+
+    The snapshot's own indexes are stored as they are, not rebuilt.
+    """
+    corrections = kb.corrections.folded()
+    # Written without the records and pooled values overwritten keys left behind
+    if isinstance(corrections, CompactCorrections): corrections = corrections.compacted()
+    else: corrections = CompactCorrections.from_items(corrections.items())
+    near_keys, near_ids = kb.near_index.export(list(corrections))
+    sections = {
+        "brands": json.dumps({"brands": kb.brands.to_dict(), "aliases": kb.brand_index.entries}).encode(),
+        "models": json.dumps(kb.model_index.entries).encode(),
+        **corrections.to_sections(),
+        "near_keys": near_keys.tobytes(),
+        "near_ids": near_ids.tobytes()
+    }
+    # Section offsets are relative to the end of the header, so the header can describe itself
+    layout, offset = {}, 0
+    for name, blob in sections.items():
+        layout[name] = [offset, len(blob)]
+        offset += -(-len(blob) // ALIGN) * ALIGN
+    header = json.dumps({"source": stamp, "corrections": len(corrections), "sections": layout}).encode()
+    header += b" " * (-len(header) % ALIGN)
+
+    with atomic_file(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for blob in sections.values():
+            f.write(blob + b"\0" * (-len(blob) % ALIGN))
+
+
+def load(path: str, source: str, version: int = 0) -> Optional[KnowledgeSnapshot]:
+    """The snapshot at `path` if it was built from `source` as it is now, else None."""
+    if not os.path.exists(path) or not os.path.exists(source): return None
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC: return None
+        header_size, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+        if header["source"] != source_stamp(source): return None
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    start = len(MAGIC) + 8 + header_size
+    if len(buffer) < start + max((o + n for o, n in header["sections"].values()), default=0): return None
+    view = memoryview(buffer)
+    sections = {name: view[start + offset:start + offset + size] for name, (offset, size) in header["sections"].items()}
+    brands = json.loads(bytes(sections["brands"]))
+    corrections = CompactCorrections.from_sections(sections)
+    near_index = NearDuplicateIndex.from_arrays(
+        np.frombuffer(sections["near_keys"], dtype=np.uint64),
+        np.frombuffer(sections["near_ids"], dtype=np.uint32),
+        corrections.key_at)
+    return KnowledgeSnapshot(
+        version,
+        LayeredMap(brands["brands"]),
+        LayeredMap(corrections),
+        LayeredFuzzyIndex(FuzzyIndex(brands["aliases"])),
+        LayeredFuzzyIndex(FuzzyIndex(json.loads(bytes(sections["models"])))),
+        near_index
+    )
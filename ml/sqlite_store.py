@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from knowledge_snapshot import correction_changes
+
+# ==========================================
+# SQLITE KNOWLEDGE STORE
+# ==========================================
+# Shared brain for several uvicorn workers on one box. Each /train commits a
+# row to `log` and updates the materialised brands/models/corrections tables
+# in the same transaction, then bumps meta.version to the log sequence.
+#
+# A worker remembers the version its snapshot reflects. Noticing a change is
+# one primary-key lookup; catching up means replaying only the log rows past
+# that version. A cold start, or a worker left behind by log trimming,
+# loads the materialised tables instead.
+
+LOG_KEEP = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS brands (alias TEXT PRIMARY KEY, brand TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS models (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS corrections (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS log (seq INTEGER PRIMARY KEY AUTOINCREMENT, raw_text TEXT NOT NULL, data TEXT NOT NULL);
+"""
+
+
+class SqliteKnowledgeStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        # sqlite3 connections stay on the thread that opened them
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def version(self) -> int:
+        row = self.connect().execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def seeded(self) -> bool:
+        return self.connect().execute("SELECT 1 FROM meta WHERE name = 'version'").fetchone() is not None
+
+    def seed(self, data: Dict):
+        """Load a JSON brain into an empty store. No-op once seeded."""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'version'").fetchone() is None:
+                conn.executemany("INSERT OR REPLACE INTO brands VALUES (?, ?)", data["brands"].items())
+                conn.executemany("INSERT OR IGNORE INTO models (name) VALUES (?)", ((m,) for m in data["models"]))
+                conn.executemany("INSERT OR REPLACE INTO corrections (key, data) VALUES (?, ?)",
+                                 ((k, json.dumps(v)) for k, v in data["corrections"].items()))
+                conn.execute("INSERT INTO meta VALUES ('version', 0)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self) -> Tuple[Dict, int]:
+        """The whole brain as a dict, plus the version it reflects."""
+        conn = self.connect()
+        conn.execute("BEGIN")
+        try:
+            data = {
+                "brands": dict(conn.execute("SELECT alias, brand FROM brands ORDER BY rowid")),
+                "models": [m for (m,) in conn.execute("SELECT name FROM models ORDER BY id")],
+                "corrections": {k: json.loads(v) for k, v in conn.execute("SELECT key, data FROM corrections ORDER BY id")}
+            }
+            version = self.version()
+        finally:
+            conn.execute("COMMIT")
+        return data, version
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, str, Dict]]]:
+        """Log records after `version`, or None if trimming already dropped some."""
+        conn = self.connect()
+        rows = conn.execute("SELECT seq, raw_text, data FROM log WHERE seq > ? ORDER BY seq", (version,)).fetchall()
+        if (not rows or rows[0][0] != version + 1) and self.version() > version: return None
+        return [(seq, raw_text, json.loads(data)) for seq, raw_text, data in rows]
+
+    def record(self, raw_text: str, corrected_data: Dict) -> int:
+        """Commit one /train record; returns the new store version."""
+        return self.record_many([(raw_text, corrected_data)])
+
+    def record_many(self, records: List[Tuple[str, Dict]]) -> int:
+        """Commit (raw_text, corrected_data) records in one transaction; returns the new store version."""
+        if not records: return self.version()
+        log, corrections, aliases, models = [], [], [], []
+        for raw_text, corrected_data in records:
+            key, record_aliases, model = correction_changes(raw_text, corrected_data)
+            payload = json.dumps(corrected_data)
+            log.append((raw_text, payload))
+            corrections.append((key, payload))
+            aliases += record_aliases
+            if model: models.append((model,))
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO log (raw_text, data) VALUES (?, ?)", log)
+            seq = conn.execute("SELECT MAX(seq) FROM log").fetchone()[0]
+            # Upserts keep the original row position, like updating a dict key
+            conn.executemany("INSERT INTO corrections (key, data) VALUES (?, ?) "
+                             "ON CONFLICT(key) DO UPDATE SET data = excluded.data", corrections)
+            conn.executemany("INSERT INTO brands VALUES (?, ?) "
+                             "ON CONFLICT(alias) DO UPDATE SET brand = excluded.brand", aliases)
+            conn.executemany("INSERT OR IGNORE INTO models (name) VALUES (?)", models)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (seq,))
+            if seq // 1000 != (seq - len(log)) // 1000:
+                conn.execute("DELETE FROM log WHERE seq <= ?", (seq - LOG_KEEP,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
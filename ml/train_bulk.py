@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Bulk import of labelled corrections.
+
+    python train_bulk.py corrections.json
+    python train_bulk.py corrections.json --url http://127.0.0.1:8000
+
+The file is a JSON list of {"input", "fixed_brand", "data"} records, the
+format of training_temp.json. All records become one knowledge snapshot,
+persisted once (one JSON write, or one SQLite transaction).
+
+Without --url the brain named by TRAINING_DATA_FILE / KNOWLEDGE_STORE is
+updated in this process. With the JSON store, stop the API first, or its
+next compaction will overwrite the import. With --url the file is posted
+to /train/bulk on a running server instead.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from typing import List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def post(url: str, listings: list) -> dict:
+    request = urllib.request.Request(url.rstrip("/") + "/train/bulk", json.dumps(listings).encode("utf-8"),
+                                     {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def train_local(listings: list) -> dict:
+    sys.path.insert(0, BASE_DIR)
+    import extractor_api
+    from pydantic import TypeAdapter
+    listings = TypeAdapter(List[extractor_api.LabelledListing]).validate_python(listings)
+    return extractor_api.train_bulk(extractor_api.labelled_records(listings))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import a labelled correction file in one step")
+    ap.add_argument("input", help="JSON list of {input, fixed_brand, data} records")
+    ap.add_argument("--url", help="post to this running API instead of updating the brain here")
+    args = ap.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        listings = json.load(f)
+    if not isinstance(listings, list): sys.exit(f"❌ {args.input} is not a JSON list of records")
+
+    started = time.perf_counter()
+    result = post(args.url, listings) if args.url else train_local(listings)
+    print(f"✅ Imported {result['records']} records in {time.perf_counter() - started:.1f}s "
+          f"({result['corrections']} corrections, {result['models']} models, {result['brands']} brand aliases)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# ==========================================
+# TRAINING JOURNAL
+# ==========================================
+# /train appends one compact JSON line here instead of rewriting the whole
+# snapshot. Startup replays the journal on top of the snapshot, and
+# compaction folds it back into a snapshot written via temp-file + rename,
+# so a crash can at worst tear the last journal line, never the snapshot.
+#
+# Compaction first rotates the live journal to "<journal>.old" so new /train
+# records keep flowing while the snapshot is written; ".old" is only deleted
+# once the snapshot has been renamed into place. Records are idempotent, so
+# replaying one that already made it into the snapshot is harmless.
+#
+# Every writer gets its own temp file, named after its process and thread:
+# workers starting together may all write the same snapshot, and the last
+# rename then wins instead of one renaming away another's half-written file.
+# (Not mkstemp, which would leave the replaced file readable by its owner only.)
+
+
+@contextmanager
+def atomic_file(path: str, mode: str = "w"):
+    """A file that replaces `path` once the block exits cleanly."""
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
+
+def write_atomic(path: str, text: str):
+    with atomic_file(path) as f:
+        f.write(text)
+
+
+class TrainingJournal:
+    def __init__(self, snapshot_file: str, journal_file: str, compact_every: int = 500):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.rotated_file = journal_file + ".old"
+        self.compact_every = compact_every
+        self.pending = 0
+        self.handle = None
+        self.compact_lock = threading.Lock()
+
+    def replay(self) -> Iterator[Dict]:
+        """Yield journaled records, oldest first. Torn lines are skipped."""
+        for path in (self.rotated_file, self.journal_file):
+            if not os.path.exists(path): continue
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line: continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+    def open_journal(self):
+        # Start on a fresh line if the last writer died mid-record
+        torn = False
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file):
+            with open(self.journal_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self.handle = open(self.journal_file, "a")
+        if torn: self.handle.write("\n")
+
+    def append(self, record: Dict):
+        if self.handle is None: self.open_journal()
+        self.handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.handle.flush()
+        self.pending += 1
+
+    def compaction_due(self) -> bool:
+        return self.pending >= self.compact_every and not self.compact_lock.locked()
+
+    def rotate(self):
+        """Move the live journal aside. Caller holds the knowledge-base lock."""
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        if os.path.exists(self.journal_file):
+            if os.path.exists(self.rotated_file):
+                # A previous compaction never finished: keep both record sets
+                with open(self.journal_file, "r") as src, open(self.rotated_file, "a") as dst:
+                    dst.write("\n" + src.read())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.rotated_file)
+        self.pending = 0
+
+    def compact(self, capture: Callable[[], Any], render: Callable[[Any], str], lock: threading.Lock,
+                persisted: Optional[Callable[[Any], None]] = None):
+        """Write the captured state as the new snapshot and retire the journal.
+
+        capture runs under the caller's knowledge-base lock together with the
+        rotation, so the snapshot holds exactly the rotated records; render
+        turns it into the snapshot text after the lock is released.
+        persisted runs right after the write, while no other compaction can
+        replace the file it just wrote.
+        """
+        with self.compact_lock:
+            with lock:
+                state = capture()
+                self.rotate()
+            write_atomic(self.snapshot_file, render(state))
+            if persisted: persisted(state)
+            if os.path.exists(self.rotated_file): os.remove(self.rotated_file)